@@ -0,0 +1,251 @@
+"""Benchmark di Super Valenti: caricamento, update e disegno su livelli sintetici di dimensioni crescenti.
+
+Esempi:
+    python bench_valenti.py                               # tutti gli scenari, stampa la tabella
+    python bench_valenti.py --save-baseline baseline.json # salva i risultati come riferimento
+    python bench_valenti.py --baseline baseline.json      # confronta e fallisce se ci sono regressioni
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Fattori di larghezza e densità degli scenari: (nome, probabilità nemico, probabilità moneta) per cella vuota
+WIDTH_FACTORS = [1, 10, 100]
+DENSITIES = [
+    ("base", 0.0, 0.0),
+    ("affollato", 0.04, 0.06),
+]
+
+
+def playable_width(level_map):
+    """Larghezza giocabile della mappa: fino alla porta più a destra compresa."""
+    return max(row.rfind("D") for row in level_map) + 1
+
+
+def make_level_map(level_map, width_factor, enemy_density, coin_density, seed=0):
+    """Ripete la parte giocabile della mappa width_factor volte e aggiunge nemici e monete sulle celle vuote."""
+    rng = random.Random(seed)
+    width = playable_width(level_map)
+    section = [row[:width].ljust(width).replace("D", " ") for row in level_map]
+    # Il terreno senza buchi: i buchi con la porta sono solo alla fine del livello
+    section[-1] = "P" * width
+    rows = [list(row * width_factor) for row in section]
+
+    for row_index in range(2, len(rows) - 1):
+        row = rows[row_index]
+        for col_index in range(8, len(row) - 8):
+            if row[col_index] != " ":
+                continue
+            roll = rng.random()
+            if roll < enemy_density:
+                row[col_index] = "E"
+            elif roll < enemy_density + coin_density:
+                row[col_index] = "C"
+
+    # Porta finale in fondo al livello, come nella mappa originale
+    rows[-1][-12:-9] = "DDD"
+    return ["".join(row) for row in rows]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(samples):
+    """p50/p99/max in millisecondi."""
+    return {
+        "p50": percentile(samples, 0.50) * 1000,
+        "p99": percentile(samples, 0.99) * 1000,
+        "max": max(samples) * 1000 if samples else 0.0,
+    }
+
+
+def scripted_actions(tick):
+    """Input scriptato: corre a destra saltando, con brevi ritorni a sinistra."""
+    if tick % 240 >= 220:
+        return {"left"}
+    if tick % 45 < 10:
+        return {"right", "jump"}
+    return {"right"}
+
+
+def run_scenario(scenario, ticks, draw):
+    """Esegue uno scenario nel processo corrente e restituisce le misure."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import valenti
+
+    level_map = make_level_map(valenti.default_level_map(), scenario["width"], scenario["enemy_density"], scenario["coin_density"])
+
+    start = time.perf_counter()
+    game = valenti.Game(headless=True, seed=0, level_map=level_map)
+    init_time = time.perf_counter() - start
+
+    # Un secondo caricamento, con gli asset già pronti, misura solo load_level
+    tracemalloc.start()
+    start = time.perf_counter()
+    game.setup()
+    load_time = time.perf_counter() - start
+    _, load_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Le fasi sono quelle cronometrate dal profiler del gioco (lo stesso dell'overlay F3)
+    profiler = valenti.FrameProfiler(history=ticks)
+    profiler.toggle()
+    game.profiler = profiler
+
+    restarts = 0
+    for tick in range(ticks):
+        profiler.begin_frame()
+        state = game.step(scripted_actions(tick))
+        if draw:
+            game.draw()
+        profiler.end_frame()
+        if state["game_over"] or state["game_complete"]:
+            restarts += 1
+            game.setup()
+
+    update_samples = []
+    draw_samples = []
+    phase_samples = {}
+    for _, stages in profiler.frames:
+        update_time = draw_time = 0.0
+        for stage, duration in stages.items():
+            phase_samples.setdefault(stage, []).append(duration / 1000)
+            if stage.startswith("draw."):
+                draw_time += duration
+            else:
+                update_time += duration
+        update_samples.append(update_time / 1000)
+        if draw:
+            draw_samples.append(draw_time / 1000)
+
+    try:
+        import resource
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError: # resource non esiste su Windows
+        peak_rss_kb = 0
+
+    return {
+        "init_ms": init_time * 1000,
+        "load_ms": load_time * 1000,
+        "load_peak_python_kb": load_peak // 1024,
+        "peak_rss_kb": peak_rss_kb,
+        "restarts": restarts,
+        "update": summarize(update_samples),
+        "draw": summarize(draw_samples),
+        "phases": {phase: summarize(samples) for phase, samples in phase_samples.items()},
+    }
+
+
+def _scenario_worker(scenario, ticks, draw, queue):
+    queue.put(run_scenario(scenario, ticks, draw))
+
+
+def run_isolated(scenario, ticks, draw):
+    """Ogni scenario gira in un processo separato, così il picco di memoria non si somma tra scenari."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_scenario_worker, args=(scenario, ticks, draw, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def build_scenarios(widths):
+    scenarios = []
+    for width in widths:
+        for name, enemy_density, coin_density in DENSITIES:
+            scenarios.append({
+                "name": f"{width}x-{name}",
+                "width": width,
+                "enemy_density": enemy_density,
+                "coin_density": coin_density,
+            })
+    return scenarios
+
+
+def flatten(result):
+    """Metriche confrontabili con il riferimento, come {nome: millisecondi}."""
+    metrics = {"load_ms": result["load_ms"]}
+    for group in ("update", "draw"):
+        for key in ("p50", "p99"):
+            metrics[f"{group}.{key}"] = result[group][key]
+    for phase, summary in result["phases"].items():
+        for key in ("p50", "p99"):
+            metrics[f"{phase}.{key}"] = summary[key]
+    return metrics
+
+
+def compare(results, baseline, threshold, noise_ms):
+    """Restituisce le regressioni oltre la soglia relativa (ignorando differenze sotto noise_ms)."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        current = flatten(result)
+        reference = flatten(baseline[name])
+        for metric, value in current.items():
+            old = reference.get(metric)
+            if old is None:
+                continue
+            if value > old * (1 + threshold) and value - old > noise_ms:
+                regressions.append((name, metric, old, value))
+    return regressions
+
+
+def print_table(results):
+    print(f"{'scenario':<16}{'init ms':>9}{'load ms':>9}{'upd p50':>9}{'upd p99':>9}{'draw p50':>9}{'draw p99':>9}{'RSS MB':>8}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['init_ms']:>9.1f}{result['load_ms']:>9.1f}"
+              f"{result['update']['p50']:>9.3f}{result['update']['p99']:>9.3f}"
+              f"{result['draw']['p50']:>9.3f}{result['draw']['p99']:>9.3f}"
+              f"{result['peak_rss_kb'] / 1024:>8.0f}")
+        slowest = sorted(result["phases"].items(), key=lambda item: item[1]["p99"], reverse=True)[:3]
+        print("    fasi più lente (p99 ms): " + ", ".join(f"{phase} {summary['p99']:.3f}" for phase, summary in slowest))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark di Super Valenti")
+    parser.add_argument("--ticks", type=int, default=600, help="tick simulati per scenario")
+    parser.add_argument("--widths", type=int, nargs="+", default=WIDTH_FACTORS, help="fattori di larghezza del livello")
+    parser.add_argument("--no-draw", action="store_true", help="non misura il disegno")
+    parser.add_argument("--output", help="salva i risultati completi in formato JSON")
+    parser.add_argument("--baseline", help="file di riferimento con cui confrontare i risultati")
+    parser.add_argument("--save-baseline", help="salva i risultati come nuovo riferimento")
+    parser.add_argument("--threshold", type=float, default=0.25, help="regressione relativa tollerata (0.25 = +25%%)")
+    parser.add_argument("--noise-ms", type=float, default=0.05, help="differenze assolute ignorate, in millisecondi")
+    args = parser.parse_args()
+
+    results = {}
+    for scenario in build_scenarios(args.widths):
+        results[scenario["name"]] = run_isolated(scenario, args.ticks, not args.no_draw)
+    print_table(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as output_file:
+                json.dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.threshold, args.noise_ms)
+        for name, metric, old, value in regressions:
+            print(f"REGRESSIONE {name} {metric}: {old:.3f} -> {value:.3f} ms")
+        if regressions:
+            return 1
+        print("Nessuna regressione rispetto al riferimento.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,22 @@
 import pygame
 import random
 import os
+import sys
+import io
+import hashlib
+import argparse
+import threading
+import time
+import zlib
+import bisect
+import re
+import json
+import gzip
+import base64
+import numpy
+import weakref
+from array import array
+from collections import OrderedDict, deque
 
 # --- Costanti di Gioco ---
 WINDOW_TITLE = "Super Valenti"
@@ -8,6 +24,60 @@ WINDOW_WIDTH = 1280
 WINDOW_HEIGHT = 720
 FPS = 60
 
+# Simulazione a passo fisso: la fisica avanza sempre di SIM_DT, il disegno interpola tra due passi
+SIM_DT = 1.0 / FPS
+MAX_CATCHUP_STEPS = 5 # Passi massimi per frame dopo un rallentamento
+MAX_RENDER_FPS = 144
+
+# Larghezza massima delle superfici pre-composte per i blocchi statici
+STATIC_CHUNK_WIDTH = 1024
+
+# Indice spaziale per il culling del rendering
+SPATIAL_CELL_SIZE = 512
+CULL_MARGIN = 128
+
+# Streaming del livello a chunk di colonne: i blocchi e la porta finale esistono solo nei chunk entro queste distanze
+# dalla finestra (nemici e oggetti fermi stanno in array per l'intero livello)
+LEVEL_CHUNK_COLUMNS = 16
+LEVEL_SPAWN_DISTANCE = 1152
+LEVEL_DESPAWN_DISTANCE = LEVEL_SPAWN_DISTANCE + STATIC_CHUNK_WIDTH # Isteresi: niente carica/scarica continuo al confine
+
+# Larghezza minima della striscia del fiume ripetuta sullo schermo
+RIVER_STRIP_MIN_WIDTH = 256
+
+# Sezioni dello sfondo: lunghezza in pixel del livello (0 = fino alla fine del livello) e livelli di parallasse
+# (immagine, velocità rispetto alla telecamera). Durante ogni sezione lo sfondo scorre gradualmente verso quello
+# della sezione successiva; l'ultima resta ferma. Parallasse 0 = fermo sullo schermo
+BACKGROUND_SECTIONS = [
+    (6000, [("background_hills.png", 0.0)]),
+    (4000, [("background_sky.png", 0.0)]),
+    (5000, [("bg.png", 0.0)]),
+    (3000, [("sunset.png", 0.0)]),
+]
+
+# Livelli di trasparenza precalcolati per ogni texture: lampeggi e dissolvenze usano il livello più vicino
+ALPHA_LEVELS = 16
+
+# Numero massimo di superfici di testo tenute in cache
+TEXT_CACHE_SIZE = 256
+
+# Profiler dei frame (F3): frame tenuti nel grafico, peggiori frame ricordati e ogni quanti frame aggiornare il testo
+PROFILER_HISTORY = 240
+PROFILER_WORST_FRAMES = 5
+PROFILER_REFRESH_FRAMES = 30
+
+# Risoluzione dinamica: il mondo si disegna più piccolo quando i frame superano il tempo obiettivo (l'HUD resta nitido)
+RENDER_TARGET_MS = 14.0 # Lavoro per frame tollerato, con un margine sotto i 16.6 ms dei 60 FPS
+RENDER_SCALE_MIN = 0.5
+RENDER_SCALE_MAX = 1.0
+RENDER_SCALE_STEP = 0.125 # Passi di 1/8: tile da 64 px e pezzi statici da 1024 px restano di misura intera
+RENDER_SCALE_HYSTERESIS = 0.25 # Si risale solo sotto l'obiettivo ridotto di questa frazione
+RENDER_SCALE_WINDOW = 30 # Frame mediati prima di ogni decisione
+
+# Cache su disco delle immagini pre-elaborate (la cartella si può cambiare con VALENTI_ASSET_CACHE)
+ASSET_CACHE_DIR = os.environ.get("VALENTI_ASSET_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "super_valenti"))
+ASSET_CACHE_VERSION = 1
+
 # Costanti di movimento e fisica
 CHARACTER_SCALE = 0.5
 COLLECTIBLE_SCALE = 0.02
@@ -45,32 +115,823 @@ SCORE_ENEMY = 10
 SCORE_BEER = 2
 SCORE_FLAG = 50 # Punteggio per la bandiera
 
+# Tasti associati alle azioni del giocatore
+KEY_ACTIONS = {
+    pygame.K_LEFT: "left",
+    pygame.K_a: "left",
+    pygame.K_RIGHT: "right",
+    pygame.K_d: "right",
+    pygame.K_UP: "jump",
+    pygame.K_w: "jump",
+    pygame.K_SPACE: "jump",
+}
+
+# Mappa del livello: P blocco, C moneta, E nemico, B birra, S cartello, D porta finale, F bandiera
+LEVEL_MAP = [
+    "                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                  ",
+    "                                                                                                                                      FE                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                            ",
+    "          P                               C                 P                 C         E                   S                  PP    PPPP              E      B                  P                                         P                                                                    P                                                                                                                                                                                                   ",
+    "        C   P     P                           S                 C   P     P E   P                             P   P                             P   P      P     P      P           P                     P                                                                                                                                                                                                                                 ",
+    "      P   P     E               P   E     P   E P   B               P E P   p   S           P E P   P   P P P     P   P     P   P       P   P     P     P         P     P   P     P       P                   P                                                                                                                                                                                                                         ",
+    "    E       S   E E         P   E   P P   E           S               P   P     P   P   P S     P     P   P     P       P   B       P P   E   P P   P E       PES       P E   E       P P   P   E P P   E       P   S ",
+    "    P   P E C     E   P E   P C     P E P C     P E P P C     P E P P S                         S                                   P     P     P     P                                                                                                                                                                                 ",
+    "    P P P P E   P P   E         P       P E P     P P         P E P P C P P   E P         P E P S         P P E   P   B       P P   E   P P   P E       PES       P E   E         P P   P   E P P   E       P   S ",
+    "PPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPDDDDDPPPPPPPPPDDPDDDPPPPPPPPDDDPPPPPPPPDDDPPPPPPPPPPPPPPPPPP",
+]
+
+# Mappe Tiled: nomi delle entità accettati nei tileset (proprietà "entity", oppure type/class del tile)
+TILED_ENTITY_NAMES = {
+    "platform": "P", "coin": "C", "enemy": "E", "beer": "B", "sign": "S", "door": "D", "flag": "F",
+}
+# Senza tile annotati: i GID 1, 2, 3... corrispondono nell'ordine a queste entità
+TILED_DEFAULT_TILES = "PCEBSDF"
+TILED_GID_MASK = 0x0FFFFFFF # I bit alti dei GID sono i flag di rotazione/specchiatura
+
 # --- Funzioni di supporto ---
+def interpolate(previous, current, alpha):
+    """Interpolazione lineare tra due passi di simulazione; con alpha >= 1 restituisce il valore attuale."""
+    if alpha >= 1:
+        return current
+    return previous + (current - previous) * alpha
+
+def default_level_map():
+    """La mappa LEVEL_MAP come la gioca Game: con la porta finale in fondo alla riga 6."""
+    level_map = list(LEVEL_MAP)
+
+    # Posiziono la porta finale e la bandiera in punti strategici della mappa
+    level_map[6] += "D"
+    for i in range(len(level_map)):
+        if len(level_map[i]) < len(level_map[6]):
+            level_map[i] += " " * (len(level_map[6]) - len(level_map[i]))
+    return level_map
+
 def get_asset_path(filename):
     """Restituisce il percorso completo di un asset."""
     return os.path.join("assets", filename)
 
-def load_image(filename, scale_factor=1):
-    """Carica e ridimensiona un'immagine."""
+class AssetCache:
+    """Cache su disco delle immagini già decodificate, ridimensionate e convertite nel formato del display."""
+    MAGIC = b"SVA1"
+
+    def __init__(self, write_dir, read_dirs=()):
+        self.write_dir = write_dir
+        # Le cartelle di sola lettura (es. la cache inclusa nel pacchetto PyInstaller) vengono provate per prime
+        self.read_dirs = list(read_dirs) + [write_dir]
+
+    def key(self, source_data, scale_factor, size):
+        digest = hashlib.sha1(source_data)
+        digest.update(repr((scale_factor, size, ASSET_CACHE_VERSION)).encode())
+        return digest.hexdigest()
+
+    def load(self, key):
+        for directory in self.read_dirs:
+            try:
+                with open(os.path.join(directory, key + ".raw"), "rb") as cache_file:
+                    data = cache_file.read()
+            except OSError:
+                continue
+            if data[:4] != self.MAGIC:
+                continue
+            width = int.from_bytes(data[4:8], "little")
+            height = int.from_bytes(data[8:12], "little")
+            pixel_format = data[12:16].decode("ascii")
+            pixels = data[16:]
+            if len(pixels) != width * height * 4:
+                continue
+            # Con lo stesso formato del display la conversione è una semplice copia
+            return pygame.image.frombuffer(pixels, (width, height), pixel_format).convert_alpha()
+        return None
+
+    def store(self, key, surface):
+        # Salva i pixel nell'ordine usato dal display (di solito BGRA) per evitare conversioni al caricamento
+        if surface.get_masks() == (0xff0000, 0xff00, 0xff, 0xff000000):
+            pixel_format = "BGRA"
+        else:
+            pixel_format = "RGBA"
+        width, height = surface.get_size()
+        header = self.MAGIC + width.to_bytes(4, "little") + height.to_bytes(4, "little") + pixel_format.encode("ascii")
+        path = os.path.join(self.write_dir, key + ".raw")
+        try:
+            os.makedirs(self.write_dir, exist_ok=True)
+            with open(path + ".tmp", "wb") as cache_file:
+                cache_file.write(header)
+                cache_file.write(pygame.image.tobytes(surface, pixel_format))
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass # La cache è solo un'ottimizzazione: se non si può scrivere si ricarica il PNG
+
+asset_cache = AssetCache(ASSET_CACHE_DIR, read_dirs=[get_asset_path("cache")])
+
+def load_image(filename, scale_factor=1, size=None):
+    """Carica e ridimensiona un'immagine, usando la cache su disco quando possibile."""
     try:
-        image = pygame.image.load(get_asset_path(filename)).convert_alpha()
+        with open(get_asset_path(filename), "rb") as image_file:
+            source_data = image_file.read()
+        key = asset_cache.key(source_data, scale_factor, size)
+        image = asset_cache.load(key)
+        if image is not None:
+            return image
+
+        image = pygame.image.load(io.BytesIO(source_data), filename).convert_alpha()
         if scale_factor != 1:
-            size = image.get_size()
-            image = pygame.transform.scale(image, (int(size[0] * scale_factor), int(size[1] * scale_factor)))
+            image_size = image.get_size()
+            image = pygame.transform.scale(image, (int(image_size[0] * scale_factor), int(image_size[1] * scale_factor)))
+        if size is not None:
+            image = pygame.transform.scale(image, size)
+        asset_cache.store(key, image)
         return image
-    except pygame.error as e:
+    except (pygame.error, OSError) as e: # OSError: il file manca o non si legge
         print(f"ATTENZIONE: File non trovato: {filename}")
         print(e)
         empty_surface = pygame.Surface((1, 1), pygame.SRCALPHA)
         return empty_surface
 
+def load_player_textures():
+    """Carica le texture del personaggio e della limousine, le uniche necessarie per l'intro."""
+    textures = {
+        'idle_right': load_image("vale1.png", scale_factor=CHARACTER_SCALE),
+        'idle_left': load_image("vale2.png", scale_factor=CHARACTER_SCALE),
+        'run_right': [load_image(f"vale1{i}.png", scale_factor=CHARACTER_SCALE) for i in range(2, 5)],
+        'run_left': [load_image(f"vale2{i}.png", scale_factor=CHARACTER_SCALE) for i in range(2, 5)],
+        'limousine': load_image("limousine.png", scale_factor=0.2) # Aggiungo la limousine
+    }
+
+    # Aggiungo vale1 e vale2 come primo frame per l'animazione di corsa
+    textures['run_right'].insert(0, textures['idle_right'])
+    textures['run_left'].insert(0, textures['idle_left'])
+    return textures
+
+def load_level_textures():
+    """Carica le texture usate solo durante il livello."""
+    return {
+        'coin': load_image("coin.png", scale_factor=COLLECTIBLE_SCALE1),
+        'beer': load_image("beer.png", scale_factor=COLLECTIBLE_SCALE),
+        'tile_terreno': load_image("tile_terreno.png"),
+        'enemy': load_image("mo.png", size=(64, 64)), # I nemici sono sempre disegnati a 64x64
+        'title': load_image("valenti.png", scale_factor=0.3)
+    }
+
+# Effetti sonori: nome -> (file, categoria). Ogni categoria ha i suoi canali riservati
+SOUND_FILES = {
+    'jump': ("jump.ogg", "player"),
+    'death': ("death.ogg", "player"),
+    'pick': ("pick.ogg", "pickup"),
+    'hit': ("hit.ogg", "combat"),
+    'collision': ("collision.ogg", "combat"),
+    'powerup': ("powerup.ogg", "pickup") # Suono per la bandiera
+}
+SOUND_CHANNELS = {"player": 2, "pickup": 4, "combat": 3}
+
+def bake_assets(cache_dir):
+    """Pre-elabora tutte le immagini nella cartella indicata (da includere nel pacchetto)."""
+    pygame.init()
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)
+    asset_cache.write_dir = cache_dir
+    asset_cache.read_dirs = [] # Rigenera sempre i file
+    load_player_textures()
+    load_level_textures()
+    Backgrounds()
+    load_image("river.png")
+    pygame.quit()
+
+def report_audio_error(error):
+    print(f"ERRORE: Impossibile caricare o riprodurre i file audio. Assicurati che siano nella cartella 'assets' e che siano in un formato compatibile (es. Ogg Vorbis). Dettagli errore: {error}")
+
+class SoundBank:
+    """Effetti sonori già decodificati, suonati su canali riservati per categoria.
+
+    play() si limita a prenotare il suono: flush() lo fa partire una sola volta per frame,
+    anche se è stato richiesto molte volte. Senza mixer (headless) non suona nulla.
+    """
+    def __init__(self, channels=SOUND_CHANNELS):
+        self.channel_counts = channels
+        self.sounds = {} # Nome -> (pygame.mixer.Sound, categoria)
+        self.pools = {} # Categoria -> canali riservati
+        self.started = {} # Categoria -> momento in cui è partito il suono di ogni canale
+        self.plays = 0
+        self.volumes = {"music": 0.5, "sfx": 1.0}
+        self.pending = {} # Suoni richiesti nel frame, nell'ordine della prima richiesta (dict: ordine deterministico)
+
+    def open(self):
+        """Riserva i canali delle categorie (da chiamare dopo pygame.mixer.init)."""
+        total = sum(self.channel_counts.values())
+        pygame.mixer.set_num_channels(max(total, pygame.mixer.get_num_channels()))
+        pygame.mixer.set_reserved(total) # Sound.play() senza canale non li userà mai
+        first = 0
+        for category, count in self.channel_counts.items():
+            self.pools[category] = [pygame.mixer.Channel(first + i) for i in range(count)]
+            self.started[category] = [0] * count
+            first += count
+
+    def add(self, name, sound, category):
+        sound.set_volume(self.volumes["sfx"])
+        self.sounds[name] = (sound, category)
+
+    def set_volume(self, group, volume):
+        """Volume di un gruppo ("music" o "sfx"), applicato subito e non a ogni riproduzione."""
+        self.volumes[group] = volume
+        if group == "music":
+            if pygame.mixer.get_init():
+                pygame.mixer.music.set_volume(volume)
+        else:
+            for sound, _ in self.sounds.values():
+                sound.set_volume(volume)
+
+    def play(self, name):
+        self.pending[name] = True
+
+    def flush(self):
+        for name in self.pending:
+            entry = self.sounds.get(name)
+            if entry is None:
+                continue
+            sound, category = entry
+            pool = self.pools[category]
+            started = self.started[category]
+            # Il primo canale libero, altrimenti si ruba quello partito da più tempo
+            index = next((i for i, channel in enumerate(pool) if not channel.get_busy()), None)
+            if index is None:
+                index = started.index(min(started))
+            self.plays += 1
+            started[index] = self.plays
+            pool[index].play(sound)
+        self.pending.clear()
+
+class AssetLoader:
+    """Carica gli asset su un thread separato; get() blocca solo se l'asset richiesto non è ancora pronto."""
+    def __init__(self):
+        self.jobs = []
+        self.results = {}
+        self.errors = {}
+        self.ready = {}
+        self.thread = None
+
+    def add(self, name, function, *args):
+        self.jobs.append((name, function, args))
+        self.ready[name] = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="asset-loader", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        for name, function, args in self.jobs:
+            try:
+                self.results[name] = function(*args)
+            except Exception as e: # L'errore viene rilanciato nel thread principale da get()
+                self.errors[name] = e
+            finally:
+                self.ready[name].set()
+
+    def get(self, name):
+        self.ready[name].wait()
+        if name in self.errors:
+            raise self.errors[name]
+        return self.results[name]
+
+# Eventi di input registrabili: il codice di un evento è la sua posizione nella lista
+INPUT_EVENTS = [
+    "pause", "restart",
+    "press_left", "release_left",
+    "press_right", "release_right",
+    "press_jump", "release_jump",
+]
+
+class InputRecording:
+    """Sessione registrata: seme del generatore casuale, impronta della mappa e gli eventi di input con il loro tick."""
+    MAGIC = b"SVR2"
+    LEGACY_MAGIC = b"SVR1" # Registrazioni senza l'impronta della mappa
+
+    def __init__(self, seed, events=None, end_tick=0, map_digest=None):
+        self.seed = seed
+        self.events = events if events is not None else [] # Lista di (tick, nome evento)
+        self.end_tick = end_tick
+        self.map_digest = map_digest # None se la mappa non è nota: la riproduzione non la controlla
+
+    def matches(self, level_map):
+        """True se la registrazione può essere stata fatta su questa mappa."""
+        return self.map_digest is None or self.map_digest == level_map_digest(level_map)
+
+    def record(self, tick, event):
+        self.events.append((tick, event))
+
+    def to_bytes(self):
+        # Varint per seme, durata, numero di eventi e differenze di tick: un'ora di gioco pesa pochi KB
+        payload = bytearray()
+        for value in (self.seed, self.end_tick, len(self.events)):
+            write_varint(payload, value)
+        digest = self.map_digest or b""
+        write_varint(payload, len(digest))
+        payload += digest
+        last_tick = 0
+        for tick, event in self.events:
+            write_varint(payload, tick - last_tick)
+            payload.append(INPUT_EVENTS.index(event))
+            last_tick = tick
+        return self.MAGIC + zlib.compress(bytes(payload), 9)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] not in (cls.MAGIC, cls.LEGACY_MAGIC):
+            raise ValueError("File di registrazione non valido")
+        payload = zlib.decompress(data[4:])
+        position = 0
+        seed, position = read_varint(payload, position)
+        end_tick, position = read_varint(payload, position)
+        count, position = read_varint(payload, position)
+        map_digest = None
+        if data[:4] == cls.MAGIC:
+            length, position = read_varint(payload, position)
+            map_digest = bytes(payload[position:position + length]) or None
+            position += length
+        events = []
+        tick = 0
+        for _ in range(count):
+            delta, position = read_varint(payload, position)
+            tick += delta
+            events.append((tick, INPUT_EVENTS[payload[position]]))
+            position += 1
+        return cls(seed, events, end_tick, map_digest)
+
+    def save(self, path):
+        with open(path, "wb") as recording_file:
+            recording_file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as recording_file:
+            return cls.from_bytes(recording_file.read())
+
+def level_map_digest(level_map):
+    """Impronta SHA-1 della mappa del livello, per riconoscere le registrazioni fatte su un'altra mappa."""
+    return hashlib.sha1("\n".join(level_map).encode("utf-8")).digest()
+
+def write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def read_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+# --- Mappe Tiled ---
+
+class TiledMapError(ValueError):
+    """File di mappa Tiled non valido; il messaggio indica file, riga e colonna del problema."""
+    def __init__(self, message, path, text=None, position=None):
+        if text is not None and position is not None:
+            line = text.count("\n", 0, position) + 1
+            column = position - text.rfind("\n", 0, position)
+            message = f"{path}:{line}:{column}: {message}"
+        else:
+            message = f"{path}: {message}"
+        super().__init__(message)
+
+class TiledJsonParser:
+    """Parser JSON scritto a mano che legge gli array "data" dei livelli direttamente in array('I'), senza liste di int Python.
+
+    Solo i "data" degli oggetti nelle liste "layers" (della mappa o di un gruppo) sono GID: altrove sono JSON qualsiasi.
+    """
+    WHITESPACE = re.compile(r"[ \t\n\r]*")
+    GID_LIST = re.compile(r"\s*\d+(?:\s*,\s*\d+)*\s*")
+    BLOCK_SIZE = 65536
+    GID_ITEM = re.compile(r"\s*\d+\s*")
+
+    def __init__(self, text, path):
+        self.text = text
+        self.path = path
+        self.position = 0
+        self.decoder = json.JSONDecoder()
+
+    def error(self, message, position=None):
+        return TiledMapError(message, self.path, self.text, self.position if position is None else position)
+
+    def skip_whitespace(self):
+        self.position = self.WHITESPACE.match(self.text, self.position).end()
+
+    def parse(self):
+        value = self.parse_value("map")
+        self.skip_whitespace()
+        if self.position != len(self.text):
+            raise self.error("contenuto inatteso dopo la fine della mappa")
+        return value
+
+    def parse_value(self, role=None):
+        """role dice cosa ci si aspetta: "map", "layers" (lista di livelli), "layer" (un livello) o "gids" (i suoi dati)."""
+        self.skip_whitespace()
+        if self.position >= len(self.text):
+            raise self.error("fine del file inattesa (file troncato?)")
+        char = self.text[self.position]
+        if char == "{":
+            return self.parse_object(role)
+        if char == "[":
+            if role == "gids":
+                return self.parse_gids()
+            return self.parse_array("layer" if role == "layers" else None)
+        # Stringhe, numeri, true/false/null: ci pensa il decoder standard
+        try:
+            value, self.position = self.decoder.raw_decode(self.text, self.position)
+        except json.JSONDecodeError as e:
+            raise self.error(e.msg, e.pos) from None
+        return value
+
+    def expect_separator(self, closing, what):
+        """Consuma ',' (restituisce True) o il carattere di chiusura (restituisce False)."""
+        self.skip_whitespace()
+        if self.position >= len(self.text):
+            raise self.error(f"fine del file dentro {what} (file troncato?)")
+        char = self.text[self.position]
+        self.position += 1
+        if char == ",":
+            return True
+        if char == closing:
+            return False
+        raise self.error(f"atteso ',' o '{closing}' dentro {what}", self.position - 1)
+
+    def parse_object(self, role=None):
+        result = {}
+        self.position += 1
+        self.skip_whitespace()
+        if self.text.startswith("}", self.position):
+            self.position += 1
+            return result
+        while True:
+            self.skip_whitespace()
+            if not self.text.startswith('"', self.position):
+                raise self.error("atteso il nome di una chiave tra virgolette")
+            key = self.parse_value()
+            self.skip_whitespace()
+            if not self.text.startswith(":", self.position):
+                raise self.error(f"atteso ':' dopo la chiave \"{key}\"")
+            self.position += 1
+            child_role = None
+            if key == "layers" and role in ("map", "layer"):
+                child_role = "layers" # Anche i gruppi di livelli hanno i loro "layers"
+            elif key == "data" and role == "layer":
+                child_role = "gids"
+            result[key] = self.parse_value(child_role)
+            if not self.expect_separator("}", "un oggetto"):
+                return result
+
+    def parse_array(self, item_role=None):
+        result = []
+        self.position += 1
+        self.skip_whitespace()
+        if self.text.startswith("]", self.position):
+            self.position += 1
+            return result
+        while True:
+            result.append(self.parse_value(item_role))
+            if not self.expect_separator("]", "un array"):
+                return result
+
+    def parse_gids(self):
+        start = self.position + 1
+        end = self.text.find("]", start)
+        if end < 0:
+            raise self.error("fine del file dentro l'array \"data\" (file troncato?)", len(self.text))
+        self.position = end + 1
+
+        if not self.text[start:end].strip():
+            return array("I")
+        if not self.GID_LIST.fullmatch(self.text, start, end):
+            self.locate_gid_error(start, end)
+        # Blocchi di circa BLOCK_SIZE caratteri tagliati su una virgola: la memoria temporanea resta limitata
+        gids = array("I")
+        try:
+            position = start
+            while position < end:
+                block_end = end
+                if end - position > self.BLOCK_SIZE:
+                    block_end = self.text.find(",", position + self.BLOCK_SIZE, end)
+                    if block_end < 0:
+                        block_end = end
+                gids.extend(map(int, self.text[position:block_end].split(",")))
+                position = block_end + 1
+            return gids
+        except OverflowError:
+            raise self.error("GID fuori intervallo nell'array \"data\"", start) from None
+
+    def locate_gid_error(self, start, end):
+        """Scorre l'array elemento per elemento solo per dire dove sta l'errore."""
+        position = start
+        while True:
+            match = self.GID_ITEM.match(self.text, position, end)
+            if match is None:
+                raise self.error("atteso un GID (intero non negativo)", self.WHITESPACE.match(self.text, position).end())
+            position = match.end()
+            if position >= end:
+                raise self.error("array \"data\" non valido", start)
+            if self.text[position] != ",":
+                raise self.error("manca una ',' tra due GID", position)
+            position += 1
+
+class TiledMap:
+    """Mappa Tiled caricata: un array di GID per ogni livello di tile più la tabella GID -> entità (P/C/E/B/S/D/F)."""
+    def __init__(self, width, height, layers, entities, path="<mappa>"):
+        self.width = width
+        self.height = height
+        self.layers = layers # Lista di (nome, array('I') di width * height GID)
+        self.entities = entities
+        self.path = path
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, encoding="utf-8") as map_file:
+                text = map_file.read()
+        except (OSError, UnicodeDecodeError) as e:
+            raise TiledMapError(f"impossibile leggere la mappa ({e})", path) from None
+        return cls.from_text(text, path)
+
+    @classmethod
+    def from_text(cls, text, path="<mappa>"):
+        data = TiledJsonParser(text, path).parse()
+        if not isinstance(data, dict) or "layers" not in data:
+            raise TiledMapError("non è una mappa Tiled (manca \"layers\")", path)
+        if data.get("infinite"):
+            raise TiledMapError("le mappe infinite non sono supportate", path)
+        width = data.get("width")
+        height = data.get("height")
+        if not isinstance(width, int) or not isinstance(height, int) or width <= 0 or height <= 0:
+            raise TiledMapError("\"width\" e \"height\" devono essere interi positivi", path)
+
+        layers = []
+        cls.collect_layers(data["layers"], width, height, path, layers)
+        return cls(width, height, layers, cls.tileset_entities(data.get("tilesets", []), path), path)
+
+    @classmethod
+    def collect_layers(cls, entries, width, height, path, layers):
+        """Aggiunge a layers i livelli di tile, entrando nei gruppi di livelli nell'ordine in cui compaiono."""
+        if not isinstance(entries, list):
+            raise TiledMapError("\"layers\" deve essere una lista di livelli", path)
+        for layer in entries:
+            if not isinstance(layer, dict):
+                raise TiledMapError("ogni elemento di \"layers\" deve essere un oggetto", path)
+            if layer.get("type") == "group":
+                cls.collect_layers(layer.get("layers", []), width, height, path, layers)
+                continue
+            if layer.get("type") != "tilelayer":
+                continue # Livelli di oggetti e immagini non hanno tile
+            name = layer.get("name", f"livello {len(layers) + 1}")
+            gids = cls.decode_layer(layer, path, name)
+            if len(gids) != width * height:
+                raise TiledMapError(f"il livello \"{name}\" ha {len(gids)} tile invece di {width}x{height}", path)
+            layers.append((name, gids))
+
+    @staticmethod
+    def decode_layer(layer, path, name):
+        data = layer.get("data")
+        if isinstance(data, array):
+            return data # CSV: già letto dal parser
+        if not isinstance(data, str) or layer.get("encoding") != "base64":
+            raise TiledMapError(f"il livello \"{name}\" non ha dati CSV o base64", path)
+        compression = layer.get("compression", "")
+        if compression not in ("", "zlib", "gzip"):
+            raise TiledMapError(f"compressione \"{compression}\" non supportata nel livello \"{name}\"", path)
+        try:
+            raw = base64.b64decode(data, validate=True)
+            if compression == "zlib":
+                raw = zlib.decompress(raw)
+            elif compression == "gzip":
+                raw = gzip.decompress(raw)
+        except (ValueError, zlib.error, OSError, EOFError) as e:
+            raise TiledMapError(f"dati base64 non validi nel livello \"{name}\" ({e})", path) from None
+        if len(raw) % 4:
+            raise TiledMapError(f"i dati del livello \"{name}\" non sono una sequenza di GID a 32 bit", path)
+        gids = array("I")
+        gids.frombytes(raw)
+        if sys.byteorder == "big":
+            gids.byteswap() # Tiled salva i GID in little endian
+        return gids
+
+    @staticmethod
+    def tileset_entities(tilesets, path):
+        """GID -> carattere della mappa, dai tile annotati nei tileset o, se non ce ne sono, da TILED_DEFAULT_TILES."""
+        entities = {}
+        for tileset in tilesets:
+            firstgid = tileset.get("firstgid", 1)
+            for tile in tileset.get("tiles", []):
+                gid = firstgid + tile.get("id", 0)
+                # type/class possono descrivere anche tile decorativi: si usano solo se sono entità note
+                for entity_name in (tile.get("type"), tile.get("class")):
+                    if isinstance(entity_name, str) and entity_name.lower() in TILED_ENTITY_NAMES:
+                        entities[gid] = TILED_ENTITY_NAMES[entity_name.lower()]
+                for prop in tile.get("properties", []):
+                    if prop.get("name") == "entity":
+                        value = str(prop.get("value", ""))
+                        char = TILED_ENTITY_NAMES.get(value.lower(), value.upper())
+                        if len(char) != 1 or char not in TILED_DEFAULT_TILES:
+                            raise TiledMapError(f"entità \"{value}\" sconosciuta nel tile {gid}", path)
+                        entities[gid] = char
+        if not entities:
+            entities = {gid: char for gid, char in enumerate(TILED_DEFAULT_TILES, start=1)}
+        return entities
+
+    def to_level_map(self):
+        """Converte la mappa nel formato a stringhe del livello; i livelli successivi coprono i precedenti."""
+        rows = bytearray(b" " * (self.width * self.height))
+        codes = {gid: ord(char) for gid, char in self.entities.items()}
+        for _, gids in self.layers:
+            for index, gid in enumerate(gids):
+                if gid:
+                    code = codes.get(gid & TILED_GID_MASK)
+                    if code is not None:
+                        rows[index] = code
+        if ord("P") not in rows:
+            # Il giocatore parte sopra la prima fila di blocchi: senza blocchi non c'è un punto di partenza
+            raise TiledMapError("la mappa non ha blocchi solidi (entità \"platform\") su cui far partire il giocatore", self.path)
+        return [rows[row * self.width:(row + 1) * self.width].decode("ascii") for row in range(self.height)]
+
+class TextCache:
+    """Registro condiviso dei font e cache LRU delle superfici di testo già renderizzate."""
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(None, size)
+            self.fonts[size] = font
+        return font
+
+    def render(self, text, size, color, antialias=True):
+        key = (text, size, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = self.font(size).render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+# --- Griglia delle collisioni ---
+
+class TileGrid:
+    """Griglia di occupazione dei blocchi solidi costruita dalla mappa del livello."""
+    def __init__(self, level_map, tile_size, solid_chars="P"):
+        self.tile_size = tile_size
+        self.rows = len(level_map)
+        self.cols = max((len(row) for row in level_map), default=0)
+        # Una bytearray per riga: 1 se la cella è solida, 0 altrimenti
+        self.cells = []
+        for row in level_map:
+            cells = bytearray(self.cols)
+            for col_index, char in enumerate(row):
+                if char in solid_chars:
+                    cells[col_index] = 1
+            self.cells.append(cells)
+
+    def colliding_tiles(self, rect):
+        """Restituisce i rettangoli dei blocchi solidi sovrapposti a rect, riga per riga."""
+        tile_size = self.tile_size
+        first_col = max(0, rect.left // tile_size)
+        last_col = min(self.cols - 1, (rect.right - 1) // tile_size)
+        first_row = max(0, rect.top // tile_size)
+        last_row = min(self.rows - 1, (rect.bottom - 1) // tile_size)
+
+        tiles = []
+        for row in range(first_row, last_row + 1):
+            cells = self.cells[row]
+            for col in range(first_col, last_col + 1):
+                if cells[col]:
+                    tiles.append(pygame.Rect(col * tile_size, row * tile_size, tile_size, tile_size))
+        return tiles
+
+class SpatialIndex:
+    """Indice spaziale a colonne: associa ogni elemento alle celle orizzontali coperte dalla sua area."""
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.order = {} # Chiave di ordinamento di ogni elemento, per mantenere l'ordine di disegno
+        self.spans = {} # Celle coperte da ogni elemento, per poterlo rimuovere
+        self.counter = 0
+
+    def empty(self):
+        self.cells = {}
+        self.order = {}
+        self.spans = {}
+
+    def insert(self, item, area, order=None):
+        """Inserisce un elemento; area è il rettangolo massimo che l'elemento può occupare.
+
+        order è la chiave di ordinamento restituita da query (predefinita: l'ordine di inserimento).
+        """
+        self.counter += 1
+        self.order[item] = self.counter if order is None else order
+        span = range(area.left // self.cell_size, (area.right - 1) // self.cell_size + 1)
+        self.spans[item] = span
+        for cell in span:
+            self.cells.setdefault(cell, []).append(item)
+
+    def remove(self, item):
+        for cell in self.spans.pop(item):
+            bucket = self.cells[cell]
+            bucket.remove(item)
+            if not bucket:
+                del self.cells[cell]
+        del self.order[item]
+
+    def query(self, left, right):
+        """Restituisce gli elementi nelle celle tra left e right, ordinati per chiave di ordinamento."""
+        found = set()
+        for cell in range(int(left) // self.cell_size, int(right) // self.cell_size + 1):
+            found.update(self.cells.get(cell, ()))
+        return sorted(found, key=self.order.__getitem__)
+
+class TextureCache:
+    """Cache delle texture ridimensionate: le superfici con stessa sorgente e dimensione sono condivise."""
+    def __init__(self):
+        self.surfaces = {}
+
+    def scaled(self, image, size):
+        key = (image, tuple(size))
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = pygame.transform.scale(image, size)
+            self.surfaces[key] = surface
+        return surface
+
+    def clear(self):
+        self.surfaces = {}
+
+texture_cache = TextureCache()
+
+class MaskCache:
+    """Maschere di collisione calcolate una sola volta per texture: le texture sono condivise, quindi anche le maschere."""
+    def __init__(self):
+        self.masks = {}
+
+    def get(self, image):
+        mask = self.masks.get(image)
+        if mask is None:
+            mask = pygame.mask.from_surface(image)
+            self.masks[image] = mask
+        return mask
+
+    def clear(self):
+        self.masks = {}
+
+mask_cache = MaskCache()
+
+class AlphaVariants:
+    """Varianti semitrasparenti delle texture condivise, create una volta per livello di alpha quantizzato.
+
+    Le texture originali non vengono mai modificate: chi lampeggia o si dissolve sceglie solo quale variante disegnare.
+    """
+    def __init__(self, levels=ALPHA_LEVELS):
+        self.levels = levels
+        self.step = 255 / (levels - 1)
+        self.variants = {}
+
+    def get(self, image, alpha):
+        level = round(alpha / self.step)
+        if level >= self.levels - 1:
+            return image
+        key = (image, level)
+        variant = self.variants.get(key)
+        if variant is None:
+            variant = image.copy()
+            variant.set_alpha(round(level * self.step))
+            self.variants[key] = variant
+        return variant
+
+    def clear(self):
+        self.variants = {}
+
+alpha_variants = AlphaVariants()
+
 # --- Classi dei personaggi (Sprite) ---
 
 class Player(pygame.sprite.Sprite):
     def __init__(self, textures):
         super().__init__()
         self.textures = textures
-        self.image = self.textures['idle_right']
+        self.base_image = self.textures['idle_right'] # Frame dell'animazione, sempre opaco
+        self.alpha = 255 # Trasparenza con cui viene disegnato il frame
+        self.image = self.base_image
+        # Maschere di tutti i frame calcolate subito: durante il gioco l'animazione le scambia soltanto
+        for image in [textures['idle_right'], textures['idle_left']] + textures['run_right'] + textures['run_left']:
+            mask_cache.get(image)
+        self.mask = mask_cache.get(self.base_image)
         
         # Ridimensiona il rettangolo di collisione per adattarsi meglio all'immagine
         self.original_rect = self.image.get_rect()
@@ -78,6 +939,7 @@ class Player(pygame.sprite.Sprite):
         self.rect.midbottom = self.original_rect.midbottom
         
         self.rect.center = (128, 128)
+        self.previous_pos = self.rect.topleft # Posizione al passo precedente, per l'interpolazione
         self.change_x = 0
         self.change_y = 0
         self.on_ground = False
@@ -85,7 +947,7 @@ class Player(pygame.sprite.Sprite):
         self.invincibility_timer = 0
         self.facing_direction = "right"
         self.animation_frame = 0
-        self.last_frame_update = pygame.time.get_ticks()
+        self.last_frame_update = 0 # Millisecondi di tempo simulato
         self.animation_speed = 100
         self.double_jump_enabled = False
         self.has_double_jumped = False
@@ -95,17 +957,18 @@ class Player(pygame.sprite.Sprite):
         self.flag_powerup_timer = 0
         self.original_speed = PLAYER_MOVEMENT_SPEED
 
-    def update(self, platforms):
+    def update(self, tile_grid, now):
+        # now è il tempo simulato in millisecondi: l'animazione non dipende dalla velocità reale del gioco
         # Gestione invincibilità da mostri
         if self.is_invincible:
             self.invincibility_timer -= 1
             if self.invincibility_timer <= 0:
                 self.is_invincible = False
-                self.image.set_alpha(255)
+                self.alpha = 255
             elif self.invincibility_timer % 10 < 5:
-                self.image.set_alpha(128)
+                self.alpha = 128
             else:
-                self.image.set_alpha(255)
+                self.alpha = 255
 
         # Gestione invincibilità dalla bandiera
         if self.is_flag_invincible:
@@ -114,44 +977,46 @@ class Player(pygame.sprite.Sprite):
                 self.is_flag_invincible = False
                 self.is_invincible = False
                 self.change_x = self.original_speed * self.facing_direction_sign()
-                self.image.set_alpha(255)
+                self.alpha = 255
             # Effetto visivo di trasparenza
             elif self.flag_powerup_timer % 5 < 3:
-                self.image.set_alpha(180)
+                self.alpha = 180
             else:
-                self.image.set_alpha(255)
+                self.alpha = 255
         
         # Animazione
-        now = pygame.time.get_ticks()
         if now - self.last_frame_update > self.animation_speed:
             self.last_frame_update = now
             if self.change_x != 0:
                 self.animation_frame = (self.animation_frame + 1) % len(self.textures['run_right'])
                 if self.facing_direction == "right":
-                    self.image = self.textures['run_right'][self.animation_frame]
+                    self.base_image = self.textures['run_right'][self.animation_frame]
                 else:
-                    self.image = self.textures['run_left'][self.animation_frame]
+                    self.base_image = self.textures['run_left'][self.animation_frame]
             else:
                 if self.facing_direction == "right":
-                    self.image = self.textures['idle_right']
+                    self.base_image = self.textures['idle_right']
                 else:
-                    self.image = self.textures['idle_left']
+                    self.base_image = self.textures['idle_left']
             
-            # Aggiorna il rettangolo di collisione in base alla nuova immagine
+            # Aggiorna maschera e rettangolo di collisione in base alla nuova immagine
+            self.mask = mask_cache.get(self.base_image)
             center = self.rect.center
-            self.rect = self.image.get_rect()
+            self.rect.size = self.base_image.get_size()
             self.rect.center = center
 
+        # La trasparenza sceglie una variante precalcolata: le texture condivise restano intatte
+        self.image = alpha_variants.get(self.base_image, self.alpha)
+
         # Movimento orizzontale
         self.rect.x += self.change_x
 
-        # Collisioni orizzontali
-        collisions = pygame.sprite.spritecollide(self, platforms, False)
-        for platform in collisions:
+        # Collisioni orizzontali (solo le celle della griglia coperte dal giocatore)
+        for tile_rect in tile_grid.colliding_tiles(self.rect):
             if self.change_x > 0:
-                self.rect.right = platform.rect.left
+                self.rect.right = tile_rect.left
             if self.change_x < 0:
-                self.rect.left = platform.rect.right
+                self.rect.left = tile_rect.right
         
         # Gravità e movimento verticale
         self.change_y += GRAVITY
@@ -159,14 +1024,13 @@ class Player(pygame.sprite.Sprite):
 
         # Collisioni verticali
         self.on_ground = False
-        collisions = pygame.sprite.spritecollide(self, platforms, False)
-        for platform in collisions:
+        for tile_rect in tile_grid.colliding_tiles(self.rect):
             if self.change_y > 0:
-                self.rect.bottom = platform.rect.top
+                self.rect.bottom = tile_rect.top
                 self.change_y = 0
                 self.on_ground = True
             elif self.change_y < 0:
-                self.rect.top = platform.rect.bottom
+                self.rect.top = tile_rect.bottom
                 self.change_y = 0
 
         # Reimposta la variabile per il doppio salto quando il giocatore tocca terra
@@ -192,144 +1056,332 @@ class Player(pygame.sprite.Sprite):
             return True
         return False
         
-class Enemy(pygame.sprite.Sprite):
-    def __init__(self, x, y, boundary_left, boundary_right, image):
-        super().__init__()
-        self.image = pygame.transform.scale(image, (64, 64))
-        self.original_image = self.image.copy()
-        self.rect = self.image.get_rect(center=(x, y))
-        self.boundary_left = boundary_left
-        self.boundary_right = boundary_right
-        self.change_x = 2
-        self.is_dying = False
-        self.death_timer = 0
+def map_cells(level_map):
+    """La mappa come matrice NumPy di un byte per cella (i caratteri non ASCII diventano '?', le righe corte si allungano)."""
+    width = max((len(row) for row in level_map), default=0)
+    return numpy.array([numpy.frombuffer(row.ljust(width).encode("ascii", "replace"), dtype=numpy.uint8) for row in level_map])
+
+class EnemyManager:
+    """Tutti i nemici del livello in array NumPy contigui, avanzati insieme con un solo passo vettoriale per tick.
+
+    Gli array sono ordinati per colonna di partenza, così le ricerche per area guardano solo una fetta.
+    Gli sprite non esistono: per i nemici da disegnare o da controllare nelle collisioni si creano
+    al momento delle EnemyView.
+    """
+    DEATH_FRAMES = 30 # Durata dell'animazione di morte
+    PATROL_DISTANCE = 200 # Distanza dei confini della pattuglia dal bordo sinistro della cella
+    SPEED = 2
+
+    def __init__(self, image, level_map, tile_size=64):
+        # La texture è condivisa tra tutti i nemici, la dissolvenza usa le sue varianti trasparenti
+        self.image = texture_cache.scaled(image, (64, 64))
+        self.mask = mask_cache.get(self.image) # Vale anche per le varianti trasparenti
+        self.width, self.height = self.image.get_size()
+
+        # Le 'E' si trovano colonna per colonna
+        grid = map_cells(level_map)
+        cols, rows = numpy.nonzero(grid.T == ord('E'))
+        self.cols = cols.astype(numpy.int32)
+        self.rows = rows.astype(numpy.int32)
+        self.spawn_x = self.cols * tile_size # Crescente: serve per searchsorted
+        # Posizione di ogni nemico nell'ordine di mappa (riga, colonna), usato per collisioni e disegno
+        self.map_order = numpy.empty(len(self.cols), dtype=numpy.int32)
+        self.map_order[numpy.lexsort((self.cols, self.rows))] = numpy.arange(len(self.cols), dtype=numpy.int32)
+
+        # Centrati nella cella, con la pattuglia attorno al bordo sinistro della cella
+        self.x = self.spawn_x + tile_size // 2 - self.width // 2
+        self.y = self.rows * tile_size + tile_size // 2 - self.height // 2
+        self.change_x = numpy.full(len(self.cols), self.SPEED, dtype=numpy.int32) # 0 per i nemici morenti o morti
+        self.boundary_left = self.spawn_x - self.PATROL_DISTANCE
+        self.turn_right = self.spawn_x + self.PATROL_DISTANCE - self.width # Il bordo destro supera boundary_right
+        self.alive = numpy.ones(len(self.cols), dtype=bool)
+        self.dying = numpy.zeros(len(self.cols), dtype=bool)
+        self.death_timer = numpy.zeros(len(self.cols), dtype=numpy.int32)
+        self.dying_count = 0
+        self.previous_x = self.x.copy() # Posizioni al passo precedente, per l'interpolazione
+        self.previous_y = self.y.copy()
+
+    def __len__(self):
+        return len(self.x)
 
     def update(self):
-        if self.is_dying:
-            self.death_timer -= 1
-            if self.death_timer > 0:
-                alpha = max(0, self.death_timer * 255 // 30)
-                self.image.set_alpha(alpha)
-                self.rect.y -= 2
-            else:
-                self.kill()
-            return
+        # Pattuglia: un passo e inversione dopo aver superato un confine (chi sta morendo ha velocità 0)
+        self.x += self.change_x
+        numpy.negative(self.change_x, out=self.change_x, where=(self.x > self.turn_right) | (self.x < self.boundary_left))
+
+        # Morte: sale e si dissolve finché il timer non si esaurisce
+        if self.dying_count:
+            dying = numpy.flatnonzero(self.dying)
+            self.death_timer[dying] -= 1
+            fading = self.death_timer[dying] > 0
+            self.y[dying[fading]] -= 2
+            finished = dying[~fading]
+            self.alive[finished] = False
+            self.dying[finished] = False
+            self.dying_count -= len(finished)
+
+    def store_previous_positions(self):
+        self.previous_x[:] = self.x
+        self.previous_y[:] = self.y
+
+    def in_rect(self, rect):
+        """Indici, in ordine di mappa (riga, colonna), dei nemici anche morenti che si sovrappongono a rect."""
+        # Solo i nemici nati abbastanza vicini possono arrivare a toccare rect durante la pattuglia
+        reach = self.PATROL_DISTANCE + self.SPEED
+        # Chiavi dello stesso tipo dell'array: con un int Python searchsorted è molto più lento
+        first = int(self.spawn_x.searchsorted(numpy.int32(rect.left - reach - self.width), "left"))
+        last = int(self.spawn_x.searchsorted(numpy.int32(rect.right + reach), "right"))
+        if first == last:
+            return []
+        # La fetta è piccola (limitata dalla pattuglia): un ciclo Python costa meno di una catena di operazioni NumPy
+        left = rect.left - self.width
+        top = rect.top - self.height
+        found = [index for index, x, y, alive in zip(range(first, last), self.x[first:last].tolist(),
+                                                     self.y[first:last].tolist(), self.alive[first:last].tolist())
+                 if alive and left < x < rect.right and top < y < rect.bottom]
+        found.sort(key=self.map_order.__getitem__)
+        return found
+
+    def views(self, rect):
+        x, y, previous_x, previous_y = self.x, self.y, self.previous_x, self.previous_y
+        return [EnemyView(self, index, x.item(index), y.item(index), (previous_x.item(index), previous_y.item(index)))
+                for index in self.in_rect(rect)]
+
+    def die(self, index):
+        if not self.dying[index]:
+            self.dying_count += 1
+        self.dying[index] = True
+        self.death_timer[index] = self.DEATH_FRAMES
+        self.change_x[index] = 0
+
+class EnemyView:
+    """Vista da sprite di un nemico dell'EnemyManager, valida solo per il passo in cui è stata creata."""
+    def __init__(self, manager, index, x, y, previous_pos):
+        self.manager = manager
+        self.index = index
+        self.rect = pygame.Rect(x, y, manager.width, manager.height)
+        self.previous_pos = previous_pos
+        self.mask = manager.mask
+
+    @property
+    def is_dying(self):
+        return bool(self.manager.dying[self.index])
+
+    @property
+    def image(self):
+        manager = self.manager
+        if not manager.dying[self.index]:
+            return manager.image
+        alpha = max(0, int(manager.death_timer[self.index]) * 255 // manager.DEATH_FRAMES)
+        return alpha_variants.get(manager.image, alpha)
 
-        self.rect.x += self.change_x
-        if self.rect.right > self.boundary_right or self.rect.left < self.boundary_left:
-            self.change_x *= -1
-            
     def die(self):
-        self.is_dying = True
-        self.death_timer = 30 # Imposta il timer per l'animazione di morte
-            
-class Collectible(pygame.sprite.Sprite):
-    def __init__(self, x, y, image, value, type):
-        super().__init__()
-        self.image = image
-        self.rect = self.image.get_rect(center=(x, y))
-        self.value = value
-        self.type = type
-
-class ItalianFlag(pygame.sprite.Sprite):
-    def __init__(self, x, y):
-        super().__init__()
-        flag_width, flag_height = 45, 60
-        pole_width, pole_height = 5, 80
-        
-        self.image = pygame.Surface((flag_width + pole_width, pole_height), pygame.SRCALPHA)
-        self.rect = self.image.get_rect(topleft=(x, y))
-
-        # Disegna il palo
-        pole_rect = pygame.Rect(0, 0, pole_width, pole_height)
-        pole_rect.bottom = pole_height
-        pygame.draw.rect(self.image, DARK_GREY, pole_rect)
-        
-        # Disegna la bandiera
-        bandiera_x = pole_width
-        bandiera_y = 0
-        
-        green_rect = pygame.Rect(bandiera_x, bandiera_y, flag_width / 3, flag_height)
-        white_rect = pygame.Rect(bandiera_x + flag_width / 3, bandiera_y, flag_width / 3, flag_height)
-        red_rect = pygame.Rect(bandiera_x + 2 * flag_width / 3, bandiera_y, flag_width / 3, flag_height)
-        
-        pygame.draw.rect(self.image, ITALY_GREEN, green_rect)
-        pygame.draw.rect(self.image, ITALY_WHITE, white_rect)
-        pygame.draw.rect(self.image, ITALY_RED, red_rect)
+        self.manager.die(self.index)
 
 class Platform(pygame.sprite.Sprite):
     def __init__(self, x, y, width, height, image=None):
         super().__init__()
         if image:
-            self.image = pygame.transform.scale(image, (width, height))
+            self.image = texture_cache.scaled(image, (width, height))
         else:
             self.image = pygame.Surface([width, height])
             self.image.fill(GREEN)
         self.rect = self.image.get_rect(topleft=(x, y))
 
-class Sign(pygame.sprite.Sprite):
-    def __init__(self, x, y, message):
-        super().__init__()
-        # Crea una superficie per il cartello e per il testo
-        sign_width, sign_height = 100, 50
-        self.image = pygame.Surface([sign_width, sign_height])
-        self.image.fill(WHITE)
-        self.rect = self.image.get_rect(center=(x, y))
-        self.message = message
-        
-        # Rendering del testo sul cartello
-        font = pygame.font.Font(None, 18)
-        lines = self.wrap_text(self.message, font, sign_width - 10)
-        
-        y_offset = 5
-        for line in lines:
-            text_surf = font.render(line, True, BLACK)
-            text_rect = text_surf.get_rect(center=(sign_width // 2, y_offset + text_surf.get_height() // 2))
-            self.image.blit(text_surf, text_rect)
-            y_offset += text_surf.get_height()
-            
-    def wrap_text(self, text, font, max_width):
-        """Suddivide il testo in righe per adattarlo alla larghezza."""
-        words = text.split(' ')
-        lines = []
-        current_line = []
-        
-        for word in words:
-            # Prova ad aggiungere la parola alla linea corrente
-            test_line = ' '.join(current_line + [word])
-            if font.size(test_line)[0] <= max_width:
-                current_line.append(word)
-            else:
-                # La linea corrente è piena, aggiungila e ricomincia
-                lines.append(' '.join(current_line))
-                current_line = [word]
-        
-        lines.append(' '.join(current_line)) # Aggiungi l'ultima linea
-        return lines
+def make_flag_image():
+    """Bandiera italiana con il palo, condivisa da tutte le bandiere del livello."""
+    flag_width, flag_height = 45, 60
+    pole_width, pole_height = 5, 80
+    image = pygame.Surface((flag_width + pole_width, pole_height), pygame.SRCALPHA)
+
+    # Disegna il palo
+    pole_rect = pygame.Rect(0, 0, pole_width, pole_height)
+    pole_rect.bottom = pole_height
+    pygame.draw.rect(image, DARK_GREY, pole_rect)
+
+    # Disegna la bandiera
+    bandiera_x = pole_width
+    bandiera_y = 0
+
+    green_rect = pygame.Rect(bandiera_x, bandiera_y, flag_width / 3, flag_height)
+    white_rect = pygame.Rect(bandiera_x + flag_width / 3, bandiera_y, flag_width / 3, flag_height)
+    red_rect = pygame.Rect(bandiera_x + 2 * flag_width / 3, bandiera_y, flag_width / 3, flag_height)
+
+    pygame.draw.rect(image, ITALY_GREEN, green_rect)
+    pygame.draw.rect(image, ITALY_WHITE, white_rect)
+    pygame.draw.rect(image, ITALY_RED, red_rect)
+    return image
+
+def wrap_text(text, font, max_width):
+    """Suddivide il testo in righe per adattarlo alla larghezza."""
+    words = text.split(' ')
+    lines = []
+    current_line = []
+
+    for word in words:
+        # Prova ad aggiungere la parola alla linea corrente
+        test_line = ' '.join(current_line + [word])
+        if font.size(test_line)[0] <= max_width:
+            current_line.append(word)
+        else:
+            # La linea corrente è piena, aggiungila e ricomincia
+            lines.append(' '.join(current_line))
+            current_line = [word]
+
+    lines.append(' '.join(current_line)) # Aggiungi l'ultima linea
+    return lines
+
+def render_sign(message, font, size=(100, 50)):
+    """Cartello bianco con il messaggio a capo sulle righe necessarie."""
+    sign_width, sign_height = size
+    image = pygame.Surface([sign_width, sign_height])
+    image.fill(WHITE)
+
+    y_offset = 5
+    for line in wrap_text(message, font, sign_width - 10):
+        text_surf = font.render(line, True, BLACK)
+        text_rect = text_surf.get_rect(center=(sign_width // 2, y_offset + text_surf.get_height() // 2))
+        image.blit(text_surf, text_rect)
+        y_offset += text_surf.get_height()
+    return image
+
+class PickupTable:
+    """Oggetti fermi del livello (monete, birre, bandiere, cartelli) in una tabella compatta di array NumPy.
+
+    Ogni casella della mappa contiene al massimo un oggetto: una griglia di indici risponde alle ricerche
+    per area guardando solo le celle coperte. Le immagini sono condivise per tipo, quelle dei cartelli
+    per messaggio, e la tabella è in ordine di disegno (monete e birre, bandiere, cartelli, ognuno in ordine di mappa).
+    """
+    COIN, BEER, FLAG, SIGN = range(4)
+    KIND_NAMES = ("coin", "beer", "flag", "sign")
+    SIGN_SIZE = (100, 50)
+    FLAG_SIZE = (50, 80)
+    FLAG_HEIGHT_ABOVE = 60 # La bandiera sta sopra la sua casella
+    SIGN_FONT_SIZE = 18
+
+    def __init__(self, level_map, coin_image, beer_image, sign_messages, sign_message_indices, text_cache, tile_size=64):
+        self.tile_size = tile_size
+        self.sign_messages = sign_messages
+        self.sign_images = {} # Indice del messaggio -> cartello disegnato, creato al primo uso
+        self.text_cache = text_cache
+        self.images = [coin_image, beer_image, make_flag_image(), None]
+        sizes = [coin_image.get_size(), beer_image.get_size(), self.FLAG_SIZE, self.SIGN_SIZE]
+        self.widths = [width for width, _ in sizes]
+        self.heights = [height for _, height in sizes]
+        values = numpy.array([SCORE_COIN, SCORE_BEER, SCORE_FLAG, SCORE_SIGN], dtype=numpy.int16)
+
+        grid = map_cells(level_map)
+        codes = numpy.full(grid.shape, 255, dtype=numpy.uint8)
+        for kind, char in enumerate("CBFS"):
+            codes[grid == ord(char)] = kind
+        rank = numpy.array([0, 0, 1, 2, 255], dtype=numpy.uint8)[numpy.minimum(codes, 4)] # Monete e birre si disegnano insieme
+        rows, cols = numpy.nonzero(codes != 255)
+        order = numpy.lexsort((cols, rows, rank[rows, cols]))
+        rows, cols = rows[order], cols[order]
+
+        self.kind = codes[rows, cols]
+        self.value = values[self.kind]
+        self.message = numpy.full(len(rows), -1, dtype=numpy.int16)
+        self.message[self.kind == self.SIGN] = sign_message_indices # I cartelli sono in ordine di mappa, come i messaggi
+        self.alive = numpy.ones(len(rows), dtype=bool)
+
+        # Monete, birre e cartelli centrati nella casella, bandiere appoggiate sopra
+        kind_widths = numpy.array(self.widths, dtype=numpy.int32)[self.kind]
+        kind_heights = numpy.array(self.heights, dtype=numpy.int32)[self.kind]
+        self.x = (cols * tile_size + tile_size // 2 - kind_widths // 2).astype(numpy.int32)
+        self.y = (rows * tile_size + tile_size // 2 - kind_heights // 2).astype(numpy.int32)
+        flags = self.kind == self.FLAG
+        self.x[flags] = cols[flags] * tile_size
+        self.y[flags] = rows[flags] * tile_size - self.FLAG_HEIGHT_ABOVE
+
+        self.cells = numpy.full(grid.shape, -1, dtype=numpy.int32) # Casella -> indice nella tabella
+        self.cells[rows, cols] = numpy.arange(len(rows), dtype=numpy.int32)
+
+    def __len__(self):
+        return len(self.kind)
+
+    def in_rect(self, rect, kinds=None):
+        """Indici, in ordine di disegno, degli oggetti non raccolti che si sovrappongono a rect."""
+        # Nessun oggetto sporge di più di una casella dalla propria: si guardano le celle coperte più un bordo
+        tile_size = self.tile_size
+        rows, cols = self.cells.shape
+        first_col = max(0, rect.left // tile_size - 1)
+        last_col = min(cols, (rect.right - 1) // tile_size + 2)
+        first_row = max(0, rect.top // tile_size - 1)
+        last_row = min(rows, (rect.bottom - 1) // tile_size + 2)
+        if first_col >= last_col or first_row >= last_row:
+            return []
+        # Il blocco di celle è piccolo: scorrerlo in Python costa meno di filtrarlo con NumPy
+        found = []
+        for row in self.cells[first_row:last_row, first_col:last_col].tolist():
+            for index in row:
+                if index < 0 or not self.alive.item(index):
+                    continue
+                kind = self.kind.item(index)
+                if kinds is not None and kind not in kinds:
+                    continue
+                x = self.x.item(index)
+                y = self.y.item(index)
+                if x < rect.right and x + self.widths[kind] > rect.left and y < rect.bottom and y + self.heights[kind] > rect.top:
+                    found.append(index)
+        found.sort()
+        return found
+
+    def collect(self, rect, kinds):
+        """Come in_rect, ma gli oggetti trovati vengono tolti dal livello."""
+        found = self.in_rect(rect, kinds)
+        if found:
+            self.alive[found] = False
+        return found
+
+    def image(self, index):
+        kind = self.kind.item(index)
+        if kind != self.SIGN:
+            return self.images[kind]
+        message = self.message.item(index)
+        image = self.sign_images.get(message)
+        if image is None:
+            font = self.text_cache.font(self.SIGN_FONT_SIZE)
+            image = self.sign_images[message] = render_sign(self.sign_messages[message], font, self.SIGN_SIZE)
+        return image
+
+    def draw(self, screen, view, camera_offset_x):
+        for index in self.in_rect(view):
+            screen.blit(self.image(index), (self.x.item(index) - camera_offset_x, self.y.item(index)))
 
 class River(pygame.sprite.Sprite):
+    """Fiume che scorre: una sola striscia di tile ripetuta sullo schermo, di dimensione indipendente dal livello."""
     def __init__(self, y, image, level_width):
         super().__init__()
         scaled_image_height = 100
         original_width = image.get_width()
-        tile_count = (level_width // original_width) + 2
-        
+        tile = pygame.transform.scale(image, (original_width, scaled_image_height))
+
+        # Con tile stretti si compone una striscia un po' più larga, così ogni frame servono pochi blit
+        tile_count = max(1, -(-RIVER_STRIP_MIN_WIDTH // original_width))
         self.image = pygame.Surface((original_width * tile_count, scaled_image_height), pygame.SRCALPHA)
-        
         for i in range(tile_count):
-            self.image.blit(pygame.transform.scale(image, (original_width, scaled_image_height)), (i * original_width, 0))
-            
-        self.rect = self.image.get_rect(topleft=(0, y))
+            self.image.blit(tile, (i * original_width, 0))
+
+        self.rect = pygame.Rect(0, y, level_width, scaled_image_height)
         self.flow_speed = 0.5
         self.x_offset = 0
 
     def update(self):
+        # Il disegno si ripete ogni larghezza di striscia: l'offset resta sempre dentro una striscia
         self.x_offset -= self.flow_speed
-        if self.x_offset < -self.image.get_width() + WINDOW_WIDTH:
-            self.x_offset = 0
+        if self.x_offset <= -self.image.get_width():
+            self.x_offset += self.image.get_width()
 
     def draw(self, screen, camera_offset_x):
-        screen.blit(self.image, (self.x_offset - camera_offset_x, self.rect.y))
+        # Solo le colonne della striscia che cadono nella finestra
+        width = self.image.get_width()
+        x = int(self.x_offset - camera_offset_x) % width
+        if x > 0:
+            x -= width
+        while x < WINDOW_WIDTH:
+            screen.blit(self.image, (x, self.rect.y))
+            x += width
 
 class Limousine(pygame.sprite.Sprite):
     def __init__(self, x, y, image):
@@ -348,56 +1400,468 @@ class Limousine(pygame.sprite.Sprite):
                 self.rect.x = self.target_x
                 self.arrived = True
 
+class StaticLayer:
+    """Strato statico: le file contigue di blocchi e sprite immobili vengono pre-composte in poche superfici grandi.
+
+    Ogni pezzo appartiene a un gruppo (per esempio il chunk del livello che lo ha creato) e si rimuove insieme al gruppo.
+    """
+    def __init__(self, chunk_width=STATIC_CHUNK_WIDTH):
+        self.chunk_width = chunk_width
+        self.pieces = {} # Identificativo -> (superficie, rettangolo nel mondo)
+        self.groups = {} # Gruppo -> identificativi dei suoi pezzi
+        self.index = SpatialIndex()
+        self.next_piece = 0
+
+    def empty(self):
+        self.pieces = {}
+        self.groups = {}
+        self.index.empty()
+
+    def add_tiles(self, tile_grid, first_col, last_col, image, group=None):
+        """Compone i blocchi solidi della griglia tra le colonne first_col e last_col (esclusa), una superficie per fila."""
+        tile_size = tile_grid.tile_size
+        for row in range(tile_grid.rows):
+            cells = tile_grid.cells[row]
+            col = first_col
+            while col < last_col:
+                if not cells[col]:
+                    col += 1
+                    continue
+                run_start = col
+                while col < last_col and cells[col]:
+                    col += 1
+                area = pygame.Rect(run_start * tile_size, row * tile_size, (col - run_start) * tile_size, tile_size)
+                surface = pygame.Surface(area.size, pygame.SRCALPHA)
+                for x in range(0, area.width, tile_size):
+                    surface.blit(image, (x, 0))
+                self.add_piece(surface, area, group, layer=0)
+
+    def add_sprites(self, sprites, group=None):
+        """Unisce gli sprite adiacenti sulla stessa riga in superfici larghe al massimo chunk_width."""
+        ordered = sorted(sprites, key=lambda sprite: (sprite.rect.top, sprite.rect.height, sprite.rect.left))
+        run = []
+        for sprite in ordered:
+            if run:
+                last = run[-1].rect
+                run_width = sprite.rect.right - run[0].rect.left
+                if (sprite.rect.top != last.top or sprite.rect.height != last.height
+                        or sprite.rect.left != last.right or run_width > self.chunk_width):
+                    self.add_run(run, group)
+                    run = []
+            run.append(sprite)
+        if run:
+            self.add_run(run, group)
+
+    def add_run(self, run, group):
+        area = run[0].rect.unionall([sprite.rect for sprite in run[1:]])
+        surface = pygame.Surface(area.size, pygame.SRCALPHA)
+        for sprite in run:
+            surface.blit(sprite.image, (sprite.rect.x - area.x, sprite.rect.y - area.y))
+        self.add_piece(surface, area, group, layer=1)
+
+    def add_piece(self, surface, area, group, layer):
+        # Gli sprite (layer 1) si disegnano sopra i blocchi (layer 0) anche se il loro chunk è stato caricato prima
+        self.next_piece += 1
+        piece = self.next_piece
+        self.pieces[piece] = (surface, area)
+        self.groups.setdefault(group, []).append(piece)
+        self.index.insert(piece, area, (layer, piece))
+
+    def remove(self, group):
+        for piece in self.groups.pop(group, ()):
+            del self.pieces[piece]
+            self.index.remove(piece)
+
+    def draw(self, screen, camera_offset_x):
+        # Disegna solo i pezzi che intersecano la finestra visibile
+        for piece in self.index.query(camera_offset_x - CULL_MARGIN, camera_offset_x + WINDOW_WIDTH + CULL_MARGIN):
+            surface, area = self.pieces[piece]
+            screen.blit(surface, (area.x - camera_offset_x, area.y))
+
 class Backgrounds:
-    def __init__(self):
-        self.backgrounds = [
-            pygame.transform.scale(load_image("background_hills.png"), (WINDOW_WIDTH, WINDOW_HEIGHT)),
-            pygame.transform.scale(load_image("background_sky.png"), (WINDOW_WIDTH, WINDOW_HEIGHT)),
-            pygame.transform.scale(load_image("bg.png"), (WINDOW_WIDTH, WINDOW_HEIGHT)),
-            pygame.transform.scale(load_image("sunset.png"), (WINDOW_WIDTH, WINDOW_HEIGHT))
-        ]
-        self.num_backgrounds = len(self.backgrounds)
-        self.current_background_index = 0
-        
-        self.background_lengths = [6000, 4000, 5000, 3000]
-    
-    def get_backgrounds_to_draw(self, player_x):
-        """Restituisce le due immagini di sfondo da disegnare e la loro posizione di transizione."""
-        
-        current_map_x = 0
-        for i, length in enumerate(self.background_lengths):
-            if player_x >= current_map_x and (length == 0 or player_x < current_map_x + length):
-                self.current_background_index = i
-                break
-            current_map_x += length
-        
-        fixed_length = sum(self.background_lengths)
-        
-        level_length = max(fixed_length, self.level_width)
-        
-        section_width = self.background_lengths[self.current_background_index] if self.background_lengths[self.current_background_index] > 0 else level_length - (fixed_length - self.background_lengths[self.current_background_index])
-        
-        transition_progress = (player_x - current_map_x) / section_width
-        transition_progress = max(0, min(1, transition_progress))
+    """Sfondi a sezioni, ognuna con uno o più livelli di parallasse; la sezione si trova con una ricerca binaria."""
+    def __init__(self, sections=BACKGROUND_SECTIONS):
+        self.section_lengths = [] # Come in BACKGROUND_SECTIONS: 0 = resto del livello
+        self.layers = [] # Per sezione: lista di (immagine, parallasse) dal fondo verso il primo piano
+        for length, layer_specs in sections:
+            layers = [(self.prepare(load_image(filename, size=(WINDOW_WIDTH, WINDOW_HEIGHT))), parallax)
+                      for filename, parallax in layer_specs]
+            # Quello che sta dietro all'ultimo livello opaco non si vedrebbe: non viene mai disegnato
+            first_visible = max((i for i, (image, _) in enumerate(layers) if not image.get_flags() & pygame.SRCALPHA), default=0)
+            self.layers.append(layers[first_visible:])
+            self.section_lengths.append(length)
+        self.set_level_width(0)
+
+    def set_level_width(self, level_width):
+        """Precalcola i confini delle sezioni: quelle di lunghezza 0 coprono quello che resta del livello."""
+        fixed_length = sum(self.section_lengths)
+        rest = max(1, max(fixed_length, level_width) - fixed_length)
+        self.starts = [] # x del livello in cui inizia ogni sezione
+        self.lengths = []
+        start = 0
+        for length in self.section_lengths:
+            length = length or rest
+            self.starts.append(start)
+            self.lengths.append(length)
+            start += length
+
+    @staticmethod
+    def prepare(image):
+        """Le immagini senza pixel trasparenti passano al formato del display senza alpha, molto più veloce da disegnare."""
+        opaque = pygame.mask.from_surface(image, 254).count() == image.get_width() * image.get_height()
+        return image.convert() if opaque else image
+
+    def section_at(self, player_x):
+        return max(0, bisect.bisect_right(self.starts, player_x) - 1)
+
+    def draw(self, screen, player_x, camera_offset_x):
+        """Disegna la sezione corrente che, man mano che si avanza, scorre via lasciando il posto alla successiva.
+
+        L'ultima sezione non ha una successiva e resta ferma fino alla fine del livello
+        (un tempo scorreva via anche lei, lasciando lo schermo senza sfondo dopo l'ultima sezione).
+        """
+        index = self.section_at(player_x)
+        if index + 1 < len(self.starts):
+            progress = (player_x - self.starts[index]) / self.lengths[index]
+            progress = max(0, min(1, progress))
+        else:
+            progress = 0
+
+        x = int(-progress * WINDOW_WIDTH)
+        if x > -WINDOW_WIDTH:
+            self.draw_section(screen, index, x, camera_offset_x)
+        # La sezione successiva entra da destra solo quando è davvero sullo schermo
+        next_x = int(-progress * WINDOW_WIDTH + WINDOW_WIDTH)
+        if index + 1 < len(self.starts) and next_x < WINDOW_WIDTH:
+            self.draw_section(screen, index + 1, next_x, camera_offset_x)
+
+    def draw_section(self, screen, index, x, camera_offset_x):
+        for image, parallax in self.layers[index]:
+            if parallax == 0:
+                screen.blit(image, (x, 0))
+                continue
+            # Livello che segue la telecamera più lentamente, ripetuto in orizzontale dentro la sezione
+            width = image.get_width()
+            clip = screen.get_clip()
+            screen.set_clip(pygame.Rect(x, 0, WINDOW_WIDTH, WINDOW_HEIGHT).clip(clip))
+            tile_x = x - int(camera_offset_x * parallax) % width
+            while tile_x < x + WINDOW_WIDTH:
+                screen.blit(image, (tile_x, 0))
+                tile_x += width
+            screen.set_clip(clip)
+
+class Hud:
+    """HUD in modalità retained: ogni riga viene renderizzata solo quando il suo contenuto cambia."""
+    LINE_HEIGHT = 20
+    FONT_SIZE = 24
+
+    def __init__(self, text_cache, title_image):
+        self.text_cache = text_cache
+        self.title_image = title_image
+        self.title_rect = title_image.get_rect(center=(WINDOW_WIDTH / 2, 50))
+        self.surface = pygame.Surface((WINDOW_WIDTH, 20 + 6 * self.LINE_HEIGHT), pygame.SRCALPHA)
+        self.line_keys = {} # Valore che ha prodotto il contenuto attuale di ogni riga
 
-        background1 = self.backgrounds[self.current_background_index]
-        background2 = None
-        
-        if self.current_background_index + 1 < self.num_backgrounds:
-            background2 = self.backgrounds[self.current_background_index + 1]
-        
-        x1 = -transition_progress * WINDOW_WIDTH
-        x2 = x1 + WINDOW_WIDTH
-        
-        return background1, background2, x1, x2
+        points_text_template = "Punti: Monete: +{coin_score} | Cartelli: +{sign_score} | Birra: +{beer_score} | Mostri: +{enemy_score} | Bandiera: +{flag_score}"
+        points_text = points_text_template.format(
+            coin_score=SCORE_COIN,
+            sign_score=SCORE_SIGN,
+            beer_score=SCORE_BEER,
+            enemy_score=SCORE_ENEMY,
+            flag_score=SCORE_FLAG
+        )
+        # Righe fisse
+        self.set_line(0, "static", "Tasti: <- -> per muoverti, SPACE per saltare", DARK_GREY)
+        self.set_line(1, "static", "Premi P per Pausa", DARK_GREY) # Etichetta per il tasto di pausa
+        self.set_line(3, "static", points_text, DARK_GREY)
+
+    def set_line(self, line, key, text, color):
+        """Ridisegna una riga solo se la chiave che la descrive è cambiata."""
+        if self.line_keys.get(line) == key:
+            return
+        self.line_keys[line] = key
+        line_rect = pygame.Rect(0, 20 + line * self.LINE_HEIGHT, WINDOW_WIDTH, self.LINE_HEIGHT)
+        self.surface.fill((0, 0, 0, 0), line_rect)
+        if text:
+            text_surf = self.text_cache.render(text, self.FONT_SIZE, color)
+            # Sulla zona appena svuotata BLEND_RGBA_MAX copia i pixel del testo così come sono
+            self.surface.blit(text_surf, (20, line_rect.y), special_flags=pygame.BLEND_RGBA_MAX)
+
+    def update(self, score, player_lives, monsters_killed, game_time, high_score_time):
+        legenda_key = (score, player_lives, monsters_killed)
+        if self.line_keys.get(2) != legenda_key:
+            self.set_line(2, legenda_key, f"Punteggio: {score}  Vite: {player_lives}  Mostri Uccisi: {monsters_killed}", DARK_GREY)
+
+        seconds_elapsed = int(game_time)
+        if self.line_keys.get(4) != seconds_elapsed:
+            minutes = int(game_time // 60)
+            seconds = int(game_time % 60)
+            self.set_line(4, seconds_elapsed, f"Tempo: {minutes:02}:{seconds:02}", DARK_GREY)
+
+        if high_score_time == float('inf'):
+            self.set_line(5, None, "", GOLDENROD)
+        elif self.line_keys.get(5) != int(high_score_time):
+            hs_minutes = int(high_score_time // 60)
+            hs_seconds = int(high_score_time % 60)
+            self.set_line(5, int(high_score_time), f"Record: {hs_minutes:02}:{hs_seconds:02}", GOLDENROD)
+
+    def draw(self, screen):
+        screen.blit(self.title_image, self.title_rect)
+        screen.blit(self.surface, (0, 0))
+
+class ScaledTarget:
+    """Superficie fuori schermo per il mondo a risoluzione ridotta.
+
+    Accetta le stesse coordinate della finestra: le immagini vengono sostituite da varianti scalate,
+    create una volta e dimenticate quando l'immagine originale non esiste più.
+    """
+    def __init__(self, scale):
+        self.scale = scale
+        self.surface = pygame.Surface((round(WINDOW_WIDTH * scale), round(WINDOW_HEIGHT * scale))).convert()
+        self.variants = weakref.WeakKeyDictionary()
+
+    def blit(self, image, pos):
+        variant = self.variants.get(image)
+        if variant is None:
+            width, height = image.get_size()
+            variant = pygame.transform.scale(image, (max(1, round(width * self.scale)), max(1, round(height * self.scale))))
+            self.variants[image] = variant
+        self.surface.blit(variant, (int(pos[0] * self.scale), int(pos[1] * self.scale)))
+
+    def get_clip(self):
+        clip = self.surface.get_clip()
+        return pygame.Rect(clip.x / self.scale, clip.y / self.scale, clip.width / self.scale, clip.height / self.scale)
+
+    def set_clip(self, rect):
+        self.surface.set_clip(pygame.Rect(rect.x * self.scale, rect.y * self.scale, rect.width * self.scale, rect.height * self.scale))
+
+class ResolutionScaler:
+    """Sceglie la scala del mondo in base alla media dei tempi di frame, con isteresi per non oscillare.
+
+    Ingrandire il mondo fino alla finestra costa, a volte più di quanto si risparmia disegnandolo piccolo:
+    la media di ogni scala comprende l'ingrandimento, e le scale già misurate non più veloci della scala
+    piena vengono saltate.
+    """
+    def __init__(self, target_ms=RENDER_TARGET_MS, min_scale=RENDER_SCALE_MIN, max_scale=RENDER_SCALE_MAX,
+                 step=RENDER_SCALE_STEP, hysteresis=RENDER_SCALE_HYSTERESIS, window=RENDER_SCALE_WINDOW):
+        self.target_ms = target_ms
+        self.hysteresis = hysteresis
+        self.window = window
+        self.levels = [] # Scale possibili, dalla più alta alla più bassa
+        scale = max_scale
+        while scale > min_scale:
+            self.levels.append(scale)
+            scale -= step
+        self.levels.append(min_scale)
+        self.level = 0
+        self.scale = max_scale
+        self.averages = {} # Scala -> ultimo tempo medio di frame misurato a quella scala
+        self.retry_below = {} # Scala -> media sotto cui riprovare a salire, dopo una salita finita subito oltre l'obiettivo
+        self.raised_from = None # (scala, media) dell'ultima salita, finché non si è vista la media della nuova scala
+        self.samples = []
+        self.targets = {} # Scala -> ScaledTarget, con le sue varianti già pronte
+
+    def record(self, frame_ms):
+        self.samples.append(frame_ms)
+        if len(self.samples) < self.window:
+            return
+        average = sum(self.samples) / len(self.samples)
+        self.samples = []
+        self.averages[self.scale] = average
+        raised_from, self.raised_from = self.raised_from, None
+        if average > self.target_ms:
+            if raised_from is not None:
+                # Salita troppo ottimista: da quella scala si riprova solo con un carico più leggero di allora
+                self.retry_below[raised_from[0]] = raised_from[1]
+            self.move(1)
+        elif average < self.target_ms * (1 - self.hysteresis) and average < self.retry_below.get(self.scale, float('inf')):
+            self.raised_from = (self.scale, average)
+            self.move(-1)
+        elif not self.pays_off(self.level):
+            self.level = 0 # Nei limiti, ma più lenta della scala piena: tanto vale disegnare nitido
+        self.scale = self.levels[self.level]
+
+    def pays_off(self, level):
+        """False se la scala è già stata misurata e non è risultata più veloce della scala piena."""
+        if level == 0:
+            return True
+        average = self.averages.get(self.levels[level])
+        native = self.averages.get(self.levels[0])
+        return average is None or native is None or average < native
+
+    def move(self, direction):
+        """Passa alla scala successiva che conviene: più bassa con direction 1, più alta con -1."""
+        level = self.level + direction
+        while 0 <= level < len(self.levels) and not self.pays_off(level):
+            level += direction
+        if 0 <= level < len(self.levels):
+            self.level = level
+        elif not self.pays_off(self.level):
+            self.level = 0
+
+    def target(self, screen):
+        """Dove disegnare il mondo: a scala piena direttamente sulla finestra."""
+        if self.scale == 1:
+            return screen
+        target = self.targets.get(self.scale)
+        if target is None:
+            target = self.targets[self.scale] = ScaledTarget(self.scale)
+        return target
+
+    def present(self, world, screen):
+        if world is not screen:
+            pygame.transform.scale(world.surface, screen.get_size(), screen)
+
+class FrameProfiler:
+    """Cronometra le fasi di ogni frame con dei "giri" (lap): ogni lap attribuisce alla fase il tempo trascorso dal precedente.
+
+    Da spento ogni chiamata costa un solo controllo, quindi può restare attivo anche nella versione distribuita.
+    """
+    PANEL_WIDTH = 340
+    COLUMNS_RIGHT = (226, 281, 336) # Bordo destro delle colonne p50, p99 e max
+    GRAPH_HEIGHT = 80
+    FONT_SIZE = 20
+    LINE_HEIGHT = 16
+
+    def __init__(self, history=PROFILER_HISTORY):
+        self.enabled = False
+        self.frames = deque(maxlen=history) # (millisecondi totali, {fase: millisecondi})
+        self.worst = [] # (millisecondi totali, numero del frame, {fase: millisecondi}), dal più lento
+        self.frame_count = 0
+        self.current = None # Fasi del frame in corso, None se il profiler è spento
+        self.last_time = 0.0
+        self.panel = None
+        self.text_lines = []
+        self.text_surfaces = [] # (superficie, posizione) del testo del pannello, rifatte da refresh_text
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.current = None
+        if self.enabled:
+            self.reset()
+
+    def reset(self):
+        self.frames.clear()
+        self.worst = []
+        self.frame_count = 0
+        self.text_lines = []
+
+    def begin_frame(self):
+        if self.enabled:
+            self.current = {}
+            self.last_time = time.perf_counter()
+
+    def lap(self, stage):
+        """Attribuisce a stage il tempo trascorso dall'ultimo lap (i tempi di più passi nello stesso frame si sommano)."""
+        if self.current is None:
+            return
+        now = time.perf_counter()
+        self.current[stage] = self.current.get(stage, 0.0) + (now - self.last_time) * 1000
+        self.last_time = now
+
+    def end_frame(self):
+        if self.current is None:
+            return
+        stages = self.current
+        self.current = None
+        total = sum(stages.values())
+        self.frame_count += 1
+        self.frames.append((total, stages))
+        if len(self.worst) < PROFILER_WORST_FRAMES or total > self.worst[-1][0]:
+            self.worst.append((total, self.frame_count, stages))
+            self.worst.sort(key=lambda frame: frame[0], reverse=True)
+            del self.worst[PROFILER_WORST_FRAMES:]
+
+    def stats(self):
+        """Percentili per fase sui frame recenti: {fase: {"p50", "p99", "max"}} in millisecondi."""
+        if not self.frames:
+            return {}
+        samples = {"frame": [total for total, _ in self.frames]}
+        for _, stages in self.frames:
+            for stage, duration in stages.items():
+                samples.setdefault(stage, []).append(duration)
+        result = {}
+        for stage, values in samples.items():
+            values.sort()
+            result[stage] = {
+                "p50": values[len(values) // 2],
+                "p99": values[min(len(values) - 1, int(len(values) * 0.99))],
+                "max": values[-1],
+            }
+        return result
+
+    def refresh_text(self, font):
+        """Ricalcola il testo del pannello e lo renderizza subito: draw() si limita a copiare le superfici."""
+        stats = self.stats()
+        # Ogni riga è una lista di colonne: la prima allineata a sinistra, le altre a destra
+        lines = [["fase (ms)", "p50", "p99", "max"]]
+        for stage, summary in sorted(stats.items(), key=lambda item: item[1]["p99"], reverse=True):
+            lines.append([stage, f"{summary['p50']:.2f}", f"{summary['p99']:.2f}", f"{summary['max']:.2f}"])
+        lines.append(["frame peggiori:"])
+        for total, frame_number, stages in self.worst:
+            culprit = max(stages, key=stages.get) if stages else "-"
+            lines.append([f"#{frame_number} {total:.2f} ms ({culprit} {stages.get(culprit, 0.0):.2f})"])
+        self.text_lines = lines
+
+        # Il testo cambia spesso: si usa il font direttamente per non riempire la cache LRU
+        self.text_surfaces = []
+        for index, columns in enumerate(lines):
+            y = self.GRAPH_HEIGHT + 6 + index * self.LINE_HEIGHT
+            self.text_surfaces.append((font.render(columns[0], True, WHITE), (4, y)))
+            for column, text in enumerate(columns[1:]):
+                text_surf = font.render(text, True, WHITE)
+                self.text_surfaces.append((text_surf, text_surf.get_rect(topright=(self.COLUMNS_RIGHT[column], y))))
+
+    def draw(self, screen, text_cache):
+        if not self.enabled:
+            return
+        if not self.text_lines or self.frame_count % PROFILER_REFRESH_FRAMES == 0:
+            self.refresh_text(text_cache.font(self.FONT_SIZE))
+
+        width = self.PANEL_WIDTH
+        height = self.GRAPH_HEIGHT + 10 + len(self.text_lines) * self.LINE_HEIGHT
+        if self.panel is None or self.panel.get_height() != height:
+            self.panel = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.panel.fill((0, 0, 0, 170))
+
+        # Grafico del tempo di lavoro per frame: la linea bianca è il budget di un frame a FPS
+        budget_ms = 1000 / FPS
+        scale = self.GRAPH_HEIGHT / (2 * budget_ms)
+        for x, (total, _) in enumerate(list(self.frames)[-width:]):
+            bar_height = min(self.GRAPH_HEIGHT, int(total * scale))
+            color = GREEN if total <= budget_ms else CRIMSON
+            self.panel.fill(color, (x, self.GRAPH_HEIGHT - bar_height, 1, bar_height))
+        budget_y = self.GRAPH_HEIGHT - int(budget_ms * scale)
+        self.panel.fill(WHITE, (0, budget_y, width, 1))
+
+        self.panel.blits(self.text_surfaces, doreturn=False)
+
+        screen.blit(self.panel, (WINDOW_WIDTH - width - 10, 10))
 
 # --- Classe principale del gioco ---
 class Game:
-    def __init__(self):
-        pygame.init()
-        self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-        pygame.display.set_caption(WINDOW_TITLE)
+    def __init__(self, headless=False, seed=None, level_map=None):
+        # In modalità headless non c'è finestra né audio: si usa solo step() per la simulazione
+        self.headless = headless
+        if headless:
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+            pygame.display.init()
+            pygame.font.init()
+            pygame.display.set_mode((1, 1)) # Serve solo per convertire le immagini nel formato del display
+            self.screen = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT)) # Disegno fuori schermo, solo su richiesta
+        else:
+            pygame.init()
+            self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+            pygame.display.set_caption(WINDOW_TITLE)
         self.clock = pygame.time.Clock()
+        self.held_actions = set()
+
+        # Generatore casuale della partita: con lo stesso seme e gli stessi input la simulazione è identica
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.recording = None # InputRecording in scrittura
+        self.replay = None # InputRecording in riproduzione
+        self.replay_index = 0
         
         self.score = 0
         self.player_lives = 3
@@ -407,8 +1871,7 @@ class Game:
         self.high_score_time = float('inf')
         self.game_time = 0.0
         self.paused = False
-        self.music_volume = 0.5
-        self.sfx_volume = 1.0
+        self.sounds = SoundBank() # Effetti sonori e volumi di musica/effetti
         
         self.display_message = False
         self.message_text = ""
@@ -448,93 +1911,48 @@ class Game:
         self.intro_message_duration = 180 # 3 secondi * 60 fps
 
         self.passed_checkpoints = set()
-        
-        self.backgrounds = Backgrounds()
-
-        # Caricamento delle texture
-        self.textures = {
-            'idle_right': load_image("vale1.png"),
-            'idle_left': load_image("vale2.png"),
-            'run_right': [load_image(f"vale1{i}.png") for i in range(2, 5)],
-            'run_left': [load_image(f"vale2{i}.png") for i in range(2, 5)],
-            'coin': load_image("coin.png", scale_factor=COLLECTIBLE_SCALE1),
-            'beer': load_image("beer.png", scale_factor=COLLECTIBLE_SCALE),
-            'tile_terreno': load_image("tile_terreno.png"),
-            'enemy': load_image("mo.png"),
-            'title': load_image("valenti.png", scale_factor=0.3),
-            'limousine': load_image("limousine.png", scale_factor=0.2) # Aggiungo la limousine
-        }
 
-        # Aggiungo vale1 e vale2 come primo frame per l'animazione di corsa
-        self.textures['run_right'].insert(0, self.textures['idle_right'])
-        self.textures['run_left'].insert(0, self.textures['idle_left'])
-        
-        # Scala le immagini del personaggio
-        for key in self.textures:
-            if isinstance(self.textures[key], list):
-                self.textures[key] = [pygame.transform.scale(img, (int(img.get_width() * CHARACTER_SCALE), int(img.get_height() * CHARACTER_SCALE))) for img in self.textures[key]]
-            else:
-                if key not in ['tile_terreno', 'coin', 'beer', 'enemy', 'title', 'limousine']:
-                    self.textures[key] = pygame.transform.scale(self.textures[key], (int(self.textures[key].get_width() * CHARACTER_SCALE), int(self.textures[key].get_height() * CHARACTER_SCALE)))
-        
-        # Carica l'immagine del fiume
-        self.river_image = load_image("river.png")
-        
-        # --- CARICAMENTO AUDIO ---
-        pygame.mixer.init()
-        try:
-            pygame.mixer.music.load(get_asset_path("background.ogg"))
-            self.jump_sound = pygame.mixer.Sound(get_asset_path("jump.ogg"))
-            self.death_sound = pygame.mixer.Sound(get_asset_path("death.ogg"))
-            self.pick_sound = pygame.mixer.Sound(get_asset_path("pick.ogg"))
-            self.hit_sound = pygame.mixer.Sound(get_asset_path("hit.ogg"))
-            self.collision_sound = pygame.mixer.Sound(get_asset_path("collision.ogg"))
-            self.powerup_sound = pygame.mixer.Sound(get_asset_path("powerup.ogg")) # Suono per la bandiera
-
-            
-            # Imposta i volumi iniziali
-            pygame.mixer.music.set_volume(self.music_volume)
-            self.jump_sound.set_volume(self.sfx_volume)
-            self.death_sound.set_volume(self.sfx_volume)
-            self.pick_sound.set_volume(self.sfx_volume)
-            self.hit_sound.set_volume(self.sfx_volume)
-            self.collision_sound.set_volume(self.sfx_volume)
-            self.powerup_sound.set_volume(self.sfx_volume)
-            
-            pygame.mixer.music.play(-1)
-        except pygame.error as e:
-            print(f"ERRORE: Impossibile caricare o riprodurre i file audio. Assicurati che siano nella cartella 'assets' e che siano in un formato compatibile (es. Ogg Vorbis). Dettagli errore: {e}")
-
-        self.level_map = [
-            "                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                  ",
-            "                                                                                                                                      FE                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                            ",
-            "          P                               C                 P                 C         E                   S                  PP    PPPP              E      B                  P                                         P                                                                    P                                                                                                                                                                                                   ",
-            "        C   P     P                           S                 C   P     P E   P                             P   P                             P   P      P     P      P           P                     P                                                                                                                                                                                                                                 ",
-            "      P   P     E               P   E     P   E P   B               P E P   p   S           P E P   P   P P P     P   P     P   P       P   P     P     P         P     P   P     P       P                   P                                                                                                                                                                                                                         ",
-            "    E       S   E E         P   E   P P   E           S               P   P     P   P   P S     P     P   P     P       P   B       P P   E   P P   P E       PES       P E   E       P P   P   E P P   E       P   S ",
-            "    P   P E C     E   P E   P C     P E P C     P E P P C     P E P P S                         S                                   P     P     P     P                                                                                                                                                                                 ",
-            "    P P P P E   P P   E         P       P E P     P P         P E P P C P P   E P         P E P S         P P E   P   B       P P   E   P P   P E       PES       P E   E         P P   P   E P P   E       P   S ",
-            "PPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPPDDDDDPPPPPPPPPDDPDDDPPPPPPPPDDDPPPPPPPPDDDPPPPPPPPPPPPPPPPPP",
-        ]
+        self.text_cache = TextCache()
+        self.profiler = FrameProfiler()
+        self.scaler = ResolutionScaler()
+
+        # Caricamento delle texture: subito solo quelle dell'intro, il resto in background
+        self.textures = load_player_textures()
+        self.assets = AssetLoader()
+        self.assets.add('level_textures', load_level_textures)
+        self.assets.add('backgrounds', Backgrounds)
+        self.assets.add('river_image', load_image, "river.png")
+        if not headless:
+            for name, (filename, _) in SOUND_FILES.items():
+                self.assets.add(f"sound_{name}", pygame.mixer.Sound, get_asset_path(filename))
+
+        # Immagine della porta finale, creata una sola volta così la cache delle texture la riusa
+        self.end_door_image = pygame.Surface([200, 250])
+        self.end_door_image.fill(BROWN)
+
+        if level_map is None:
+            self.level_map = default_level_map()
+        else:
+            # Mappa passata dall'esterno (es. benchmark): tutte le righe alla stessa lunghezza
+            longest = max(len(row) for row in level_map)
+            self.level_map = [row.ljust(longest) for row in level_map]
 
-        # Posiziono la porta finale e la bandiera in punti strategici della mappa
-        self.level_map[6] += "D"
-        for i in range(len(self.level_map)):
-            if len(self.level_map[i]) < len(self.level_map[6]):
-                self.level_map[i] += " " * (len(self.level_map[6]) - len(self.level_map[i]))
+        self.map_digest = level_map_digest(self.level_map)
 
         tile_size = 64
         self.level_width = len(self.level_map[0]) * tile_size
         self.level_height = len(self.level_map) * tile_size
+        self.chunk_count = (len(self.level_map[0]) + LEVEL_CHUNK_COLUMNS - 1) // LEVEL_CHUNK_COLUMNS
 
-        self.backgrounds.level_width = self.level_width
+        # Griglia dei blocchi solidi usata per le collisioni del giocatore
+        self.tile_grid = TileGrid(self.level_map, tile_size)
         
-        self.all_sprites = pygame.sprite.Group()
-        self.platforms = pygame.sprite.Group()
-        self.enemies = pygame.sprite.Group()
-        self.collectibles = pygame.sprite.Group()
-        self.flags = pygame.sprite.Group()
-        self.signs = pygame.sprite.Group()
+        self.static_layer = StaticLayer()
+        self.sim_tick = 0
+        self.level_chunks = set() # Chunk i cui blocchi sono nello strato statico
+        self.door_cell = None
+        self.enemies = None # EnemyManager del livello, creato da load_level
+        self.pickups = None # PickupTable del livello (monete, birre, bandiere, cartelli), creata da load_level
         self.end_door = pygame.sprite.GroupSingle()
         
         self.intro_state = "limo_intro"
@@ -547,11 +1965,32 @@ class Game:
         self.player.rect.midbottom = (self.limousine.rect.right - 80, self.limousine.rect.bottom)
 
         self.camera_offset_x = 0
+        self.previous_camera_offset_x = 0
         self.game_time = 0.0
         self.game_over = False
         self.game_complete = False
         self.passed_checkpoints = set()
 
+        # --- CARICAMENTO AUDIO ---
+        # Gli effetti vengono decodificati dal caricatore; la musica è in streaming e parte subito
+        if headless:
+            self.assets.start()
+            self.begin_session()
+            self.setup() # Senza intro: il livello è subito pronto per step()
+        else:
+            pygame.mixer.init()
+            self.sounds.open()
+            self.assets.start()
+            self.start_music()
+
+    def start_music(self):
+        try:
+            pygame.mixer.music.load(get_asset_path("background.ogg"))
+            pygame.mixer.music.set_volume(self.sounds.volumes["music"])
+            pygame.mixer.music.play(-1)
+        except (pygame.error, OSError) as e:
+            report_audio_error(e)
+
     def setup(self):
         """Resets the game state to start a new game after the intro."""
         self.score = 0
@@ -565,58 +2004,102 @@ class Game:
         self.intro_state = "ready" # Imposta lo stato su "ready" per saltare l'intro
         self.load_level() # Carica subito il livello
 
+    def finish_loading(self):
+        """Attende gli asset caricati in background (di solito già pronti alla fine dell'intro)."""
+        if self.assets is None:
+            return
+        assets, self.assets = self.assets, None
+
+        self.textures.update(assets.get('level_textures'))
+        self.backgrounds = assets.get('backgrounds')
+        self.backgrounds.set_level_width(self.level_width)
+        self.river_image = assets.get('river_image')
+        self.hud = Hud(self.text_cache, self.textures['title'])
+
+        if self.headless:
+            return
+        # Un effetto che manca o non si decodifica resta muto, gli altri suonano comunque
+        for name, (_, category) in SOUND_FILES.items():
+            try:
+                self.sounds.add(name, assets.get(f"sound_{name}"), category)
+            except (pygame.error, OSError) as e:
+                report_audio_error(e)
+
     def load_level(self):
         # Questo metodo viene chiamato per caricare il livello principale
-        self.all_sprites.empty()
-        self.platforms.empty()
-        self.enemies.empty()
-        self.collectibles.empty()
-        self.flags.empty()
-        self.signs.empty()
+        self.finish_loading()
+        self.static_layer.empty()
         self.end_door.empty()
+        self.level_chunks = set()
         
         self.river = River(self.level_height + 40, self.river_image, self.level_width)
         self.player.double_jump_enabled = False
         
         tile_size = 64
-        end_door_object = None 
-        
-        for row_index, row in enumerate(self.level_map):
-            for col_index, char in enumerate(row):
-                x = col_index * tile_size
-                y = row_index * tile_size
-                if char == 'P':
-                    platform = Platform(x, y, tile_size, tile_size, image=self.textures['tile_terreno'])
-                    self.platforms.add(platform)
-                elif char == 'C':
-                    coin = Collectible(x + tile_size/2, y + tile_size/2, self.textures['coin'], SCORE_COIN, 'coin')
-                    self.collectibles.add(coin)
-                elif char == 'E':
-                    enemy = Enemy(x + tile_size/2, y + tile_size/2, x - 200, x + 200, self.textures['enemy'])
-                    self.enemies.add(enemy)
-                elif char == 'B':
-                    beer = Collectible(x + tile_size/2, y + tile_size/2, self.textures['beer'], SCORE_BEER, 'beer')
-                    self.collectibles.add(beer)
-                elif char == 'S':
-                    sign = Sign(x + tile_size/2, y + tile_size/2, random.choice(self.sign_messages))
-                    self.signs.add(sign)
-                elif char == 'D':
-                    end_door_image = pygame.Surface([200, 250]) 
-                    end_door_image.fill(BROWN)
-                    end_door_object = Platform(x, y - 190, 200, 250, image=end_door_image)
-                elif char == 'F':
-                    flag = ItalianFlag(x, y - 60) # Posiziona la bandiera sopra il platform
-                    self.flags.add(flag)
-
-        self.all_sprites.add(self.platforms, self.enemies, self.collectibles, self.flags, self.signs, self.player)
-        
-        if end_door_object:
-            self.all_sprites.add(end_door_object)
-            self.end_door.add(end_door_object)
-        
-        # Posiziona il giocatore sul livello principale
-        first_platform_y = self.platforms.sprites()[0].rect.top
-        self.player.rect.midbottom = (100, first_platform_y)
+
+        # I messaggi dei cartelli si estraggono in ordine di mappa (indici nella lista dei messaggi)
+        sign_message_indices = [self.rng.randrange(len(self.sign_messages))
+                                for row in self.level_map for _ in range(row.count('S'))]
+
+        # Nemici e oggetti non seguono i chunk: vivono tutti in array compatti per l'intero livello
+        self.enemies = EnemyManager(self.textures['enemy'], self.level_map, tile_size)
+        self.pickups = PickupTable(self.level_map, self.textures['coin'], self.textures['beer'],
+                                   self.sign_messages, sign_message_indices, self.text_cache, tile_size)
+
+        # Se la mappa ha più porte vale l'ultima
+        self.door_cell = None
+        for row_index in range(len(self.level_map) - 1, -1, -1):
+            col_index = self.level_map[row_index].rfind('D')
+            if col_index >= 0:
+                self.door_cell = (col_index, row_index)
+                break
+
+        # Posiziona il giocatore sopra la prima fila di blocchi del livello
+        first_platform_row = next(row_index for row_index, row in enumerate(self.level_map) if 'P' in row)
+        self.player.rect.midbottom = (100, first_platform_row * tile_size)
+
+        self.update_level_stream()
+        self.store_previous_positions() # Niente interpolazione dalle posizioni della partita precedente
+
+    def update_level_stream(self):
+        """Carica i blocchi dei chunk vicini alla telecamera e rimuove quelli dei chunk rimasti indietro."""
+        chunk_width = LEVEL_CHUNK_COLUMNS * 64
+        first = max(0, int(self.camera_offset_x - LEVEL_SPAWN_DISTANCE) // chunk_width)
+        last = min(self.chunk_count - 1, int(self.camera_offset_x + WINDOW_WIDTH + LEVEL_SPAWN_DISTANCE) // chunk_width)
+        for chunk in range(first, last + 1):
+            if chunk not in self.level_chunks:
+                self.spawn_chunk(chunk)
+
+        keep_left = self.camera_offset_x - LEVEL_DESPAWN_DISTANCE
+        keep_right = self.camera_offset_x + WINDOW_WIDTH + LEVEL_DESPAWN_DISTANCE
+        for chunk in list(self.level_chunks):
+            if (chunk + 1) * chunk_width < keep_left or chunk * chunk_width > keep_right:
+                self.despawn_chunk(chunk)
+
+    def spawn_chunk(self, chunk):
+        """Aggiunge allo strato statico i blocchi di un chunk e, se vi si trova, la porta finale."""
+        tile_size = 64
+        first_col = chunk * LEVEL_CHUNK_COLUMNS
+        last_col = min(first_col + LEVEL_CHUNK_COLUMNS, len(self.level_map[0]))
+
+        # I blocchi e la porta finale non si muovono mai: vanno nello strato statico
+        tile_image = texture_cache.scaled(self.textures['tile_terreno'], (tile_size, tile_size))
+        self.static_layer.add_tiles(self.tile_grid, first_col, last_col, tile_image, group=chunk)
+        if self.door_cell is not None and first_col <= self.door_cell[0] < last_col:
+            col_index, row_index = self.door_cell
+            door = Platform(col_index * tile_size, row_index * tile_size - 190, 200, 250, image=self.end_door_image)
+            door.spawn_cell = self.door_cell
+            self.static_layer.add_sprites([door], group=chunk)
+            self.end_door.add(door)
+        self.level_chunks.add(chunk)
+
+    def despawn_chunk(self, chunk):
+        """Rimuove i blocchi di un chunk."""
+        self.level_chunks.discard(chunk)
+        self.static_layer.remove(chunk)
+        door = self.end_door.sprite
+        if door is not None and door.spawn_cell[0] // LEVEL_CHUNK_COLUMNS == chunk:
+            self.end_door.empty()
     
     def calculate_final_score(self):
         """Calcola il punteggio finale combinando punti e tempo."""
@@ -654,8 +2137,11 @@ class Game:
     def run(self):
         running = True
         
+        accumulator = 0.0
         while running:
-            delta_time = self.clock.tick(FPS) / 1000.0
+            frame_time = self.clock.tick(MAX_RENDER_FPS) / 1000.0
+            frame_start = time.perf_counter()
+            self.profiler.begin_frame()
             
             mouse_x, mouse_y = pygame.mouse.get_pos()
             mouse_pressed = pygame.mouse.get_pressed()[0]
@@ -663,85 +2149,218 @@ class Game:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.profiler.toggle() # Non fa parte della partita: non viene registrato
+                elif self.replay is not None:
+                    continue # Durante la riproduzione gli input arrivano dalla registrazione
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_p:
-                        self.paused = not self.paused
-                        if self.paused:
-                            pygame.mixer.music.pause()
-                            self.current_encouraging_message = random.choice(self.encouraging_messages)
-                        else:
-                            pygame.mixer.music.unpause()
+                        self.apply_input("pause")
                     
                     if not self.paused and (self.game_over or self.game_complete):
                         if event.key == pygame.K_r:
-                            self.setup()
+                            self.apply_input("restart")
                     elif not self.paused and self.intro_state == "ready":
-                        if event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                            self.player.change_x = -self.player.original_speed
-                            if self.player.is_flag_invincible:
-                                self.player.change_x -= FLAG_SPEED_BOOST
-                            self.player.facing_direction = "left"
-                        elif event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                            self.player.change_x = self.player.original_speed
-                            if self.player.is_flag_invincible:
-                                self.player.change_x += FLAG_SPEED_BOOST
-                            self.player.facing_direction = "right"
-                        elif (event.key == pygame.K_UP or event.key == pygame.K_w or event.key == pygame.K_SPACE):
-                            if self.player.on_ground:
-                                self.player.jump()
-                                self.jump_sound.set_volume(self.sfx_volume)
-                                self.jump_sound.play()
-                            else:
-                                if self.player.double_jump():
-                                    self.jump_sound.set_volume(self.sfx_volume)
-                                    self.jump_sound.play()
+                        if event.key in KEY_ACTIONS:
+                            self.apply_input("press_" + KEY_ACTIONS[event.key])
 
                 elif event.type == pygame.KEYUP:
                     if not self.paused and self.intro_state == "ready":
-                        if (event.key == pygame.K_LEFT or event.key == pygame.K_a) and self.player.change_x < 0:
-                            self.player.change_x = 0
-                        elif (event.key == pygame.K_RIGHT or event.key == pygame.K_d) and self.player.change_x > 0:
-                            self.player.change_x = 0
+                        if event.key in KEY_ACTIONS:
+                            self.apply_input("release_" + KEY_ACTIONS[event.key])
+
+            if self.replay is not None and self.intro_state == "ready":
+                self.apply_replay_events()
+            self.profiler.lap("events")
 
             # Gestione degli slider del volume quando il gioco è in pausa
             if self.paused and mouse_pressed:
                 # Slider Musica
                 if 400 <= mouse_y <= 420:
-                    self.music_volume = (mouse_x - (WINDOW_WIDTH // 2 - 100)) / 200
-                    self.music_volume = max(0.0, min(1.0, self.music_volume))
-                    pygame.mixer.music.set_volume(self.music_volume)
+                    volume = (mouse_x - (WINDOW_WIDTH // 2 - 100)) / 200
+                    self.sounds.set_volume("music", max(0.0, min(1.0, volume)))
 
                 # Slider Effetti Sonori
                 if 480 <= mouse_y <= 500:
-                    self.sfx_volume = (mouse_x - (WINDOW_WIDTH // 2 - 100)) / 200
-                    self.sfx_volume = max(0.0, min(1.0, self.sfx_volume))
-                    
-                    # Aggiorna il volume per tutti i suoni
-                    self.jump_sound.set_volume(self.sfx_volume)
-                    self.death_sound.set_volume(self.sfx_volume)
-                    self.pick_sound.set_volume(self.sfx_volume)
-                    self.hit_sound.set_volume(self.sfx_volume)
-                    self.collision_sound.set_volume(self.sfx_volume)
+                    volume = (mouse_x - (WINDOW_WIDTH // 2 - 100)) / 200
+                    self.sounds.set_volume("sfx", max(0.0, min(1.0, volume)))
             
             if self.intro_state == "limo_intro":
-                self.update_intro_sequence()
-                self.draw_intro_sequence()
+                accumulator += frame_time
+                steps = 0
+                while accumulator >= SIM_DT and steps < MAX_CATCHUP_STEPS and self.intro_state == "limo_intro":
+                    self.update_intro_sequence()
+                    accumulator -= SIM_DT
+                    steps += 1
+                if self.intro_state == "limo_intro":
+                    self.draw_intro_sequence()
+                else:
+                    accumulator = 0.0
             elif self.intro_state == "ready":
                 if not self.paused and not self.game_over and not self.game_complete:
-                    self.game_time += delta_time
-                    self.update()
-                    self.draw()
-                elif self.paused:
-                    self.draw_pause_menu()
-                elif self.game_over:
-                    self.draw_end_screen("GAME OVER", CRIMSON, "Premi 'R' per riavviare")
-                elif self.game_complete:
-                    self.draw_end_screen("Bravo Valenti sei riuscito anche questa volta!", GREEN, "Premi 'R' per riavviare")
-
+                    accumulator += frame_time
+                    steps = 0
+                    while accumulator >= SIM_DT and steps < MAX_CATCHUP_STEPS and not self.game_over and not self.game_complete:
+                        self.tick()
+                        accumulator -= SIM_DT
+                        steps += 1
+                    if steps == MAX_CATCHUP_STEPS:
+                        # Troppo indietro: si rinuncia a recuperare invece di rallentare ancora di più
+                        accumulator = min(accumulator, SIM_DT)
+                    self.draw(accumulator / SIM_DT)
+                else:
+                    accumulator = 0.0
+                    if self.paused:
+                        self.draw_pause_menu()
+                    elif self.game_over:
+                        self.draw_end_screen("GAME OVER", CRIMSON, "Premi 'R' per riavviare")
+                    elif self.game_complete:
+                        self.draw_end_screen("Bravo Valenti sei riuscito anche questa volta!", GREEN, "Premi 'R' per riavviare")
+
+            self.sounds.flush() # Gli effetti richiesti in questo frame partono tutti qui
+            self.profiler.lap("draw.other")
+            self.profiler.draw(self.screen, self.text_cache)
+            self.profiler.lap("profiler")
+            # Solo il lavoro del frame: né l'attesa del limitatore di FPS né display.flip, che con il vsync aspetta lo schermo
+            frame_ms = (time.perf_counter() - frame_start) * 1000
             pygame.display.flip()
+            self.profiler.lap("display.flip")
+            self.scaler.record(frame_ms)
+            self.profiler.end_frame()
 
+        self.close()
         pygame.quit()
 
+    def close(self):
+        """Svuota le cache condivise a livello di modulo: le texture di questa partita non servono più."""
+        texture_cache.clear()
+        mask_cache.clear()
+        alpha_variants.clear()
+
+    def begin_session(self):
+        """Inizio della partita registrabile: riparte dal seme e dal tick zero con un giocatore nuovo.
+
+        Tutto lo stato che influisce sulla simulazione riparte da capo (il resto lo azzerano setup e load_level),
+        così la stessa sessione si riproduce identica anche su una partita già giocata.
+        """
+        self.rng.seed(self.seed)
+        self.sim_tick = 0
+        self.replay_index = 0
+        self.held_actions = set()
+        self.player = Player(self.textures) # Animazione, velocità, timer e dimensioni del rettangolo da capo
+        self.display_message = False
+        self.message_timer = 0
+        if self.recording is not None:
+            self.recording.seed = self.seed
+            self.recording.map_digest = self.map_digest
+            self.recording.events = []
+            if self.paused:
+                self.recording.record(self.sim_tick, "pause") # La partita inizia già in pausa
+
+    def apply_input(self, event):
+        """Applica un evento di input (vedi INPUT_EVENTS) registrandolo se la registrazione è attiva."""
+        if self.recording is not None and self.intro_state == "ready":
+            self.recording.record(self.sim_tick, event)
+
+        if event == "pause":
+            self.paused = not self.paused
+            if self.paused:
+                # Il messaggio è solo estetico: non usa il generatore della partita
+                self.current_encouraging_message = random.choice(self.encouraging_messages)
+            if not self.headless:
+                if self.paused:
+                    pygame.mixer.music.pause()
+                else:
+                    pygame.mixer.music.unpause()
+        elif event == "restart":
+            self.setup()
+        elif event.startswith("press_"):
+            self.press_action(event[len("press_"):])
+        elif event.startswith("release_"):
+            self.release_action(event[len("release_"):])
+
+    def apply_replay_events(self):
+        """Applica gli eventi registrati che cadono nel tick corrente."""
+        events = self.replay.events
+        while self.replay_index < len(events) and events[self.replay_index][0] <= self.sim_tick:
+            self.apply_input(events[self.replay_index][1])
+            self.replay_index += 1
+
+    def play_recording(self, recording):
+        """Riproduce una registrazione alla massima velocità (modalità headless) e restituisce lo stato finale."""
+        if not recording.matches(self.level_map):
+            raise ValueError("La registrazione è stata fatta su un'altra mappa")
+        self.replay = recording
+        self.seed = recording.seed
+        self.paused = False
+        self.begin_session()
+        self.setup()
+        while True:
+            self.apply_replay_events()
+            if self.sim_tick >= recording.end_tick:
+                break
+            if self.paused or self.game_over or self.game_complete:
+                break # In una registrazione valida qui non ci sono altri tick da simulare
+            self.tick()
+        self.replay = None
+        return self.state()
+
+    def press_action(self, action):
+        """Applica la pressione di un'azione del giocatore ("left", "right" o "jump")."""
+        if action == "left":
+            self.player.change_x = -self.player.original_speed
+            if self.player.is_flag_invincible:
+                self.player.change_x -= FLAG_SPEED_BOOST
+            self.player.facing_direction = "left"
+        elif action == "right":
+            self.player.change_x = self.player.original_speed
+            if self.player.is_flag_invincible:
+                self.player.change_x += FLAG_SPEED_BOOST
+            self.player.facing_direction = "right"
+        elif action == "jump":
+            if self.player.on_ground:
+                self.player.jump()
+                self.sounds.play("jump")
+            else:
+                if self.player.double_jump():
+                    self.sounds.play("jump")
+
+    def release_action(self, action):
+        if action == "left" and self.player.change_x < 0:
+            self.player.change_x = 0
+        elif action == "right" and self.player.change_x > 0:
+            self.player.change_x = 0
+
+    def step(self, actions=()):
+        """Avanza la simulazione di un tick tenendo premute le azioni indicate (modalità headless)."""
+        held = set(actions)
+        for action in sorted(self.held_actions - held):
+            self.apply_input("release_" + action)
+        for action in sorted(held - self.held_actions):
+            self.apply_input("press_" + action)
+        self.held_actions = held
+
+        if not self.paused and not self.game_over and not self.game_complete:
+            self.tick()
+        return self.state()
+
+    def state(self):
+        """Istantanea dello stato di gioco, utile per test automatici e controlli di regressione."""
+        return {
+            'tick': self.sim_tick,
+            'x': self.player.rect.x,
+            'y': self.player.rect.y,
+            'change_x': self.player.change_x,
+            'change_y': self.player.change_y,
+            'on_ground': self.player.on_ground,
+            'score': self.score,
+            'lives': self.player_lives,
+            'monsters_killed': self.monsters_killed,
+            'game_time': self.game_time,
+            'game_over': self.game_over,
+            'game_complete': self.game_complete,
+        }
+
     def update_intro_sequence(self):
         # La limousine si muove verso la posizione di destinazione
         self.limousine.update()
@@ -757,6 +2376,7 @@ class Game:
 
             # Se tutti i messaggi sono stati mostrati, transizione al gioco
             if self.message_index >= len(self.intro_messages):
+                self.begin_session()
                 self.intro_state = "ready"
                 self.load_level()
             else:
@@ -777,38 +2397,61 @@ class Game:
             self.screen.blit(self.player.image, self.player.rect)
 
         # Disegna il messaggio di benvenuto e i messaggi esagerati
-        font_large = pygame.font.Font(None, 80) # Carattere più grande
-        
-        # Messaggio introduttivo fisso
-        text_surf = font_large.render("Preparati, Valenti!", True, GOLDENROD)
+        # Messaggio introduttivo fisso (carattere più grande)
+        text_surf = self.text_cache.render("Preparati, Valenti!", 80, GOLDENROD)
         text_rect = text_surf.get_rect(center=(WINDOW_WIDTH // 2, 50))
         self.screen.blit(text_surf, text_rect)
         
         # Messaggi esagerati a rotazione e scorrevoli
         if self.limousine.arrived and self.message_index < len(self.intro_messages):
             message, color = self.intro_messages[self.message_index]
-            font_exaggerated = pygame.font.Font(None, 72)
-            exaggerated_surf = font_exaggerated.render(message, True, color)
+            exaggerated_surf = self.text_cache.render(message, 72, color)
             exaggerated_rect = exaggerated_surf.get_rect(midleft=(self.intro_text_x, WINDOW_HEIGHT // 2))
             self.screen.blit(exaggerated_surf, exaggerated_rect)
 
+    def tick(self):
+        """Un passo di simulazione a tempo fisso."""
+        if self.replay is not None:
+            self.apply_replay_events()
+        self.store_previous_positions()
+        self.game_time += SIM_DT
+        self.update()
+
+    def store_previous_positions(self):
+        """Ricorda le posizioni prima del passo, per interpolare il disegno tra due passi."""
+        self.previous_camera_offset_x = self.camera_offset_x
+        self.player.previous_pos = self.player.rect.topleft
+        self.enemies.store_previous_positions()
+
     def update(self):
-        self.player.update(self.platforms)
+        profiler = self.profiler
+        profiler.lap("sim.other")
+        self.update_level_stream()
+        profiler.lap("level.stream")
+        self.player.update(self.tile_grid, self.sim_tick * 1000 // FPS)
+        profiler.lap("player.update")
         self.enemies.update()
+        profiler.lap("enemies.update")
         self.river.update()
+        profiler.lap("river.update")
 
         self.handle_collectibles()
+        profiler.lap("handle_collectibles")
         self.handle_flags()
+        profiler.lap("handle_flags")
         self.handle_signs()
+        profiler.lap("handle_signs")
         self.handle_enemies()
+        profiler.lap("handle_enemies")
         self.handle_end_door()
+        profiler.lap("handle_end_door")
         self.handle_checkpoints()
+        profiler.lap("handle_checkpoints")
         
         if self.player.rect.top > self.river.rect.top and not self.player.on_ground:
             self.player_lives = 0
             self.game_over = True
-            self.death_sound.set_volume(self.sfx_volume)
-            self.death_sound.play()
+            self.sounds.play("death")
         
         target_x = self.player.rect.centerx - WINDOW_WIDTH / 2
         self.camera_offset_x += (target_x - self.camera_offset_x) * 0.1
@@ -821,28 +2464,26 @@ class Game:
             self.message_timer -= 1
             if self.message_timer <= 0:
                 self.display_message = False
-            
+
+        self.sim_tick += 1
+        profiler.lap("sim.other")
+
     def handle_collectibles(self):
-        collectibles_hit = pygame.sprite.spritecollide(self.player, self.collectibles, True)
-        for collectible in collectibles_hit:
-            self.pick_sound.set_volume(self.sfx_volume)
-            self.pick_sound.play()
-            if collectible.type == 'coin':
-                self.score += SCORE_COIN
-            elif collectible.type == 'beer':
+        pickups = self.pickups
+        for index in pickups.collect(self.player.rect, (PickupTable.COIN, PickupTable.BEER)):
+            self.sounds.play("pick")
+            self.score += int(pickups.value[index])
+            if pickups.kind[index] == PickupTable.BEER:
                 self.player_lives += 1
-                self.score += SCORE_BEER
                 self.player.double_jump_enabled = True
                 self.display_message = True
                 self.message_text = f"Doppio Salto Abilitato! (Punti +{SCORE_BEER})"
                 self.message_timer = FPS * 3
 
     def handle_flags(self):
-        flags_hit = pygame.sprite.spritecollide(self.player, self.flags, True)
-        for flag in flags_hit:
-            self.powerup_sound.set_volume(self.sfx_volume)
-            self.powerup_sound.play()
-            self.score += SCORE_FLAG
+        for index in self.pickups.collect(self.player.rect, (PickupTable.FLAG,)):
+            self.sounds.play("powerup")
+            self.score += int(self.pickups.value[index])
             
             self.player.is_invincible = True
             self.player.is_flag_invincible = True
@@ -859,25 +2500,25 @@ class Game:
             self.message_timer = FPS * 3
 
     def handle_signs(self):
-        signs_hit = pygame.sprite.spritecollide(self.player, self.signs, True)
-        for sign in signs_hit:
-            self.pick_sound.set_volume(self.sfx_volume)
-            self.pick_sound.play()
-            self.score += SCORE_SIGN
-            if sign not in self.passed_checkpoints:
-                self.passed_checkpoints.add(sign)
+        pickups = self.pickups
+        for index in pickups.collect(self.player.rect, (PickupTable.SIGN,)):
+            self.sounds.play("pick")
+            self.score += int(pickups.value[index])
+            if index not in self.passed_checkpoints:
+                self.passed_checkpoints.add(index)
                 self.display_message = True
-                self.message_text = f"{sign.message} (Punti +{SCORE_SIGN})"
+                self.message_text = f"{self.sign_messages[pickups.message[index]]} (Punti +{SCORE_SIGN})"
                 self.message_timer = FPS * 3
 
     def handle_enemies(self):
-        enemies_hit = pygame.sprite.spritecollide(self.player, self.enemies, False, pygame.sprite.collide_mask)
+        # Prima il test dei rettangoli su tutti gli array, poi le maschere solo per i nemici sovrapposti (già in ordine di mappa)
+        enemies_hit = [enemy for enemy in self.enemies.views(self.player.rect)
+                       if pygame.sprite.collide_mask(self.player, enemy)]
         
         for enemy in enemies_hit:
             if self.player.is_flag_invincible:
                 enemy.die()
-                self.hit_sound.set_volume(self.sfx_volume)
-                self.hit_sound.play()
+                self.sounds.play("hit")
                 self.monsters_killed += 1
                 self.score += SCORE_ENEMY
                 continue
@@ -885,23 +2526,20 @@ class Game:
             if self.player.change_y > 0 and self.player.rect.bottom <= enemy.rect.centery:
                 if not enemy.is_dying:
                     enemy.die()
-                    self.hit_sound.set_volume(self.sfx_volume)
-                    self.hit_sound.play()
+                    self.sounds.play("hit")
                     self.monsters_killed += 1
                     self.score += SCORE_ENEMY
                     self.player.change_y = PLAYER_JUMP_SPEED / 2
                     return
             elif not self.player.is_invincible and not enemy.is_dying:
-                self.collision_sound.set_volume(self.sfx_volume)
-                self.collision_sound.play()
+                self.sounds.play("collision")
                 self.player_lives -= 1
                 self.player.is_invincible = True
                 self.player.invincibility_timer = FPS * 2
                 
                 if self.player_lives <= 0:
                     self.game_over = True
-                    self.death_sound.set_volume(self.sfx_volume)
-                    self.death_sound.play()
+                    self.sounds.play("death")
                 return
 
     def handle_end_door(self):
@@ -913,76 +2551,55 @@ class Game:
     def handle_checkpoints(self):
         pass
 
-    def draw(self):
-        bg1, bg2, x1, x2 = self.backgrounds.get_backgrounds_to_draw(self.player.rect.x)
-        self.screen.blit(bg1, (x1, 0))
-        if bg2:
-            self.screen.blit(bg2, (x2, 0))
-        
-        self.river.draw(self.screen, self.camera_offset_x)
-
-        for sprite in self.all_sprites:
-            self.screen.blit(sprite.image, (sprite.rect.x - self.camera_offset_x, sprite.rect.y))
+    def draw(self, alpha=1.0):
+        # alpha indica quanto siamo avanti tra il passo di simulazione precedente e quello attuale
+        camera_offset_x = interpolate(self.previous_camera_offset_x, self.camera_offset_x, alpha)
+        player_x = interpolate(self.player.previous_pos[0], self.player.rect.x, alpha)
+        profiler = self.profiler
+        profiler.lap("draw.other")
+
+        # Il mondo va sulla superficie scelta dallo scaler, l'HUD sempre sulla finestra
+        world = self.scaler.target(self.screen)
+        self.backgrounds.draw(world, player_x, camera_offset_x)
+        profiler.lap("draw.background")
+        
+        self.river.draw(world, camera_offset_x)
+        profiler.lap("draw.river")
+        self.static_layer.draw(world, camera_offset_x)
+        profiler.lap("draw.static")
+
+        # Solo ciò che interseca la finestra (più un margine): nemici, oggetti fermi e per ultimo il giocatore
+        view = pygame.Rect(camera_offset_x - CULL_MARGIN, -CULL_MARGIN, WINDOW_WIDTH + 2 * CULL_MARGIN, WINDOW_HEIGHT + 2 * CULL_MARGIN)
+        for enemy in self.enemies.views(view):
+            self.draw_interpolated(world, enemy, alpha, camera_offset_x)
+        self.pickups.draw(world, view, camera_offset_x)
+        self.draw_interpolated(world, self.player, alpha, camera_offset_x)
+        profiler.lap("draw.sprites")
+
+        self.scaler.present(world, self.screen)
+        profiler.lap("draw.scale")
 
         self.draw_hud()
+        profiler.lap("draw.hud")
         
         if self.display_message:
-            font = pygame.font.Font(None, 40)
-            text_surf = font.render(self.message_text, True, GOLDENROD)
+            text_surf = self.text_cache.render(self.message_text, 40, GOLDENROD)
             text_rect = text_surf.get_rect(center=(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2))
             self.screen.blit(text_surf, text_rect)
             
-    def draw_hud(self,):
-        font = pygame.font.Font(None, 24)
-
-        title_rect = self.textures['title'].get_rect(center=(WINDOW_WIDTH / 2, 50))
-        self.screen.blit(self.textures['title'], title_rect)
+    def draw_interpolated(self, world, sprite, alpha, camera_offset_x):
+        x = interpolate(sprite.previous_pos[0], sprite.rect.x, alpha)
+        y = interpolate(sprite.previous_pos[1], sprite.rect.y, alpha)
+        world.blit(sprite.image, (x - camera_offset_x, y))
 
-        controlli_text = "Tasti: <- -> per muoverti, SPACE per saltare"
-        controlli_surf = font.render(controlli_text, True, DARK_GREY)
-        self.screen.blit(controlli_surf, (20, 20))
-        
-        # Aggiunta dell'etichetta per il tasto di pausa
-        pause_text = "Premi P per Pausa"
-        pause_surf = font.render(pause_text, True, DARK_GREY)
-        self.screen.blit(pause_surf, (20, 40))
-
-        legenda_text = f"Punteggio: {self.score}  Vite: {self.player_lives}  Mostri Uccisi: {self.monsters_killed}"
-        legenda_surf = font.render(legenda_text, True, DARK_GREY)
-        self.screen.blit(legenda_surf, (20, 60))
-        
-        points_text_template = "Punti: Monete: +{coin_score} | Cartelli: +{sign_score} | Birra: +{beer_score} | Mostri: +{enemy_score} | Bandiera: +{flag_score}"
-        points_text = points_text_template.format(
-            coin_score=SCORE_COIN,
-            sign_score=SCORE_SIGN,
-            beer_score=SCORE_BEER,
-            enemy_score=SCORE_ENEMY,
-            flag_score=SCORE_FLAG
-        )
-        points_surf = font.render(points_text, True, DARK_GREY)
-        self.screen.blit(points_surf, (20, 80))
-        
-        minutes = int(self.game_time // 60)
-        seconds = int(self.game_time % 60)
-        time_text = f"Tempo: {minutes:02}:{seconds:02}"
-        time_surf = font.render(time_text, True, DARK_GREY)
-        self.screen.blit(time_surf, (20, 100))
-        
-        if self.high_score_time != float('inf'):
-            hs_minutes = int(self.high_score_time // 60)
-            hs_seconds = int(self.high_score_time % 60)
-            high_score_text = f"Record: {hs_minutes:02}:{hs_seconds:02}"
-            high_score_surf = font.render(high_score_text, True, GOLDENROD)
-            self.screen.blit(high_score_surf, (20, 120))
+    def draw_hud(self):
+        self.hud.update(self.score, self.player_lives, self.monsters_killed, self.game_time, self.high_score_time)
+        self.hud.draw(self.screen)
 
     def draw_end_screen(self, title, title_color, message):
         self.screen.fill(BLACK)
-        font_title = pygame.font.Font(None, 72)
-        font_message = pygame.font.Font(None, 36)
-        font_score_rank = pygame.font.Font(None, 24)
-        
-        title_render = font_title.render(title, True, title_color)
-        message_render = font_message.render(message, True, WHITE)
+        title_render = self.text_cache.render(title, 72, title_color)
+        message_render = self.text_cache.render(message, 36, WHITE)
 
         title_rect = title_render.get_rect(center=(WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2 - 100))
         message_rect = message_render.get_rect(center=(WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2 + 50))
@@ -994,11 +2611,11 @@ class Game:
         score_rank = self.get_score_rank(final_score)
         
         score_text = f"Punteggio Finale: {final_score}"
-        score_surf = font_message.render(score_text, True, LIGHT_BLUE)
+        score_surf = self.text_cache.render(score_text, 36, LIGHT_BLUE)
         score_rect = score_surf.get_rect(center=(WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2 - 20))
         self.screen.blit(score_surf, score_rect)
         
-        rank_surf = font_score_rank.render(score_rank, True, GOLDENROD)
+        rank_surf = self.text_cache.render(score_rank, 24, GOLDENROD)
         rank_rect = rank_surf.get_rect(center=(WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2 + 10))
         self.screen.blit(rank_surf, rank_rect)
         
@@ -1008,29 +2625,25 @@ class Game:
         overlay.fill((0, 0, 0, 128))
         self.screen.blit(overlay, (0, 0))
 
-        font = pygame.font.Font(None, 60)
-        font_small = pygame.font.Font(None, 30)
-
-        title = font.render("PAUSA", True, WHITE)
+        title = self.text_cache.render("PAUSA", 60, WHITE)
         title_rect = title.get_rect(center=(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 - 200))
         self.screen.blit(title, title_rect)
 
-        resume_text = font_small.render("Premi P per riprendere", True, WHITE)
+        resume_text = self.text_cache.render("Premi P per riprendere", 30, WHITE)
         resume_rect = resume_text.get_rect(center=(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 - 120))
         self.screen.blit(resume_text, resume_rect)
         
         # Frase di incoraggiamento
-        encouraging_surf = font_small.render(self.current_encouraging_message, True, WHITE)
+        encouraging_surf = self.text_cache.render(self.current_encouraging_message, 30, WHITE)
         encouraging_rect = encouraging_surf.get_rect(center=(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 - 80))
         self.screen.blit(encouraging_surf, encouraging_rect)
 
         # Disegno gli slider
-        self.draw_volume_slider("MUSICA", self.music_volume, WINDOW_HEIGHT // 2 - 40)
-        self.draw_volume_slider("EFFETTI SONORI", self.sfx_volume, WINDOW_HEIGHT // 2 + 40)
+        self.draw_volume_slider("MUSICA", self.sounds.volumes["music"], WINDOW_HEIGHT // 2 - 40)
+        self.draw_volume_slider("EFFETTI SONORI", self.sounds.volumes["sfx"], WINDOW_HEIGHT // 2 + 40)
         
     def draw_volume_slider(self, label, volume, y_pos):
-        font_small = pygame.font.Font(None, 30)
-        label_text = font_small.render(label, True, WHITE)
+        label_text = self.text_cache.render(label, 30, WHITE)
         label_rect = label_text.get_rect(center=(WINDOW_WIDTH // 2, y_pos - 20))
         self.screen.blit(label_text, label_rect)
         
@@ -1052,5 +2665,74 @@ class Game:
         pygame.draw.circle(self.screen, WHITE, (int(handle_x), handle_y), 10)
 
 if __name__ == "__main__":
-    game = Game()
+    parser = argparse.ArgumentParser(description=WINDOW_TITLE)
+    parser.add_argument("--bake-assets", metavar="DIR", nargs="?", const=get_asset_path("cache"),
+                        help="pre-elabora le immagini nella cache su disco (predefinita: assets/cache) ed esce")
+    parser.add_argument("--headless", metavar="TICKS", type=int,
+                        help="simula TICKS tick senza finestra né audio correndo verso destra e stampa lo stato finale")
+    parser.add_argument("--seed", type=int, help="seme del generatore casuale della partita")
+    parser.add_argument("--record", metavar="FILE", help="registra gli input della partita in FILE")
+    parser.add_argument("--replay", metavar="FILE", help="riproduce una partita registrata con --record")
+    parser.add_argument("--fast", action="store_true", help="con --replay: riproduce senza finestra alla massima velocità")
+    parser.add_argument("--map", metavar="FILE", help="gioca il livello di una mappa Tiled (JSON, dati CSV o base64 con zlib/gzip)")
+    parser.add_argument("--render-target-ms", type=float, default=RENDER_TARGET_MS,
+                        help="tempo di frame oltre il quale il mondo viene disegnato a risoluzione ridotta")
+    parser.add_argument("--render-scale", metavar=("MIN", "MAX"), type=float, nargs=2, default=(RENDER_SCALE_MIN, RENDER_SCALE_MAX),
+                        help="limiti della scala del mondo (1 1 disattiva la risoluzione dinamica)")
+    parser.add_argument("--render-hysteresis", type=float, default=RENDER_SCALE_HYSTERESIS,
+                        help="frazione sotto l'obiettivo necessaria per tornare a una risoluzione più alta")
+    args = parser.parse_args()
+
+    if args.bake_assets:
+        bake_assets(args.bake_assets)
+        sys.exit(0)
+
+    level_map = None
+    if args.map:
+        try:
+            level_map = TiledMap.load(args.map).to_level_map()
+        except TiledMapError as e:
+            sys.exit(f"Mappa non valida: {e}")
+
+    min_scale, max_scale = args.render_scale
+    scaler = ResolutionScaler(target_ms=args.render_target_ms, min_scale=min_scale, max_scale=max_scale,
+                              hysteresis=args.render_hysteresis)
+
+    if args.headless:
+        game = Game(headless=True, seed=args.seed, level_map=level_map)
+        start = time.perf_counter()
+        for tick in range(args.headless):
+            state = game.step({"right", "jump"} if tick % 30 < 15 else {"right"})
+            if state['game_over'] or state['game_complete']:
+                game.setup()
+        elapsed = time.perf_counter() - start
+        print(state)
+        print(f"{args.headless} tick in {elapsed:.2f} s ({args.headless / elapsed:.0f} tick/s)")
+        sys.exit(0)
+
+    if args.replay:
+        recording = InputRecording.load(args.replay)
+        if not recording.matches(level_map if level_map is not None else default_level_map()):
+            sys.exit("La registrazione è stata fatta su un'altra mappa: usa la stessa --map della registrazione")
+        if args.fast:
+            game = Game(headless=True, seed=recording.seed, level_map=level_map)
+            start = time.perf_counter()
+            state = game.play_recording(recording)
+            elapsed = time.perf_counter() - start
+            print(state)
+            print(f"{recording.end_tick} tick riprodotti in {elapsed:.2f} s")
+        else:
+            game = Game(seed=recording.seed, level_map=level_map)
+            game.scaler = scaler
+            game.replay = recording
+            game.run()
+        sys.exit(0)
+
+    game = Game(seed=args.seed, level_map=level_map)
+    game.scaler = scaler
+    if args.record:
+        game.recording = InputRecording(game.seed)
     game.run()
+    if args.record:
+        game.recording.end_tick = game.sim_tick
+        game.recording.save(args.record)
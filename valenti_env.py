@@ -0,0 +1,291 @@
+"""Ambienti in stile gym per far giocare agenti automatici a Super Valenti (senza finestra né audio).
+
+Esempio:
+    with VectorValentiEnv(8, seed=0) as env:
+        observations = env.reset()
+        for _ in range(1000):
+            observations, rewards, dones = env.step(numpy.random.randint(len(ACTIONS), size=env.num_envs))
+
+La ricompensa di ogni passo è la variazione del punteggio meno la penalità di tempo di calculate_final_score,
+anche all'ultimo passo: la somma delle ricompense di un episodio è punteggio meno penalità senza il minimo a zero
+di calculate_final_score. Il punteggio finale vero (mai negativo) è in info["final_score"] ed episode_scores.
+"""
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy
+
+# Azioni discrete: tasti tenuti premuti durante il tick
+ACTIONS = [
+    (),
+    ("left",),
+    ("right",),
+    ("jump",),
+    ("left", "jump"),
+    ("right", "jump"),
+]
+
+# Nemici più vicini descritti nell'osservazione, come (dx, dy, presente)
+OBSERVATION_ENEMIES = 4
+# Finestra di blocchi solidi attorno al giocatore: colonne dietro e davanti a lui, per tutte le righe della mappa
+OBSERVATION_COLUMNS_BEHIND = 2
+OBSERVATION_COLUMNS_AHEAD = 10
+PLAYER_FIELDS = 8
+
+# Durata massima di un episodio (2 minuti di gioco a 60 tick al secondo)
+MAX_EPISODE_TICKS = 7200
+
+
+def observation_size(rows):
+    columns = OBSERVATION_COLUMNS_BEHIND + 1 + OBSERVATION_COLUMNS_AHEAD
+    return PLAYER_FIELDS + 3 * OBSERVATION_ENEMIES + rows * columns
+
+
+class ValentiEnv:
+    """Una partita headless con reset()/step() in stile gym; le osservazioni sono vettori float32."""
+    def __init__(self, seed=0, level_map=None, max_ticks=MAX_EPISODE_TICKS):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        import valenti
+        self.game = valenti.Game(headless=True, seed=seed, level_map=level_map)
+        self.max_ticks = max_ticks
+        self.observation_size = observation_size(self.game.tile_grid.rows)
+        self.returned = 0 # Somma delle ricompense date finora nell'episodio
+
+    def reset(self, seed=None, out=None):
+        """Nuovo episodio: con lo stesso seme e le stesse azioni si ripete identico a quello di un ambiente nuovo."""
+        game = self.game
+        if seed is not None:
+            game.seed = seed
+        game.paused = False
+        game.begin_session() # Giocatore nuovo e tick zero: nulla dell'episodio precedente sopravvive
+        game.setup()
+        self.returned = 0
+        return self.observe(out)
+
+    def step(self, action, out=None):
+        """Avanza di un tick; restituisce (osservazione, ricompensa, finito, info)."""
+        game = self.game
+        game.step(ACTIONS[action])
+        done = game.game_over or game.game_complete
+        truncated = not done and game.sim_tick >= self.max_ticks
+
+        # Punteggio meno penalità di tempo, come calculate_final_score ma senza il minimo a zero: con il minimo
+        # l'ultimo passo di un episodio in perdita pagherebbe un premio, e morire presto converrebbe
+        total = game.score - int(game.game_time * 100)
+        reward = total - self.returned
+        self.returned = total
+
+        info = {"truncated": truncated, "final_score": game.calculate_final_score(), "game_complete": game.game_complete}
+        return self.observe(out), reward, done or truncated, info
+
+    def close(self):
+        self.game.close()
+
+    def observe(self, out=None):
+        if out is None:
+            out = numpy.empty(self.observation_size, dtype=numpy.float32)
+        game = self.game
+        player = game.player
+        out[:PLAYER_FIELDS] = (
+            player.rect.x,
+            player.rect.y,
+            player.change_x,
+            player.change_y,
+            player.on_ground,
+            player.double_jump_enabled and not player.has_double_jumped,
+            player.is_flag_invincible,
+            game.player_lives,
+        )
+
+        enemies = out[PLAYER_FIELDS:PLAYER_FIELDS + 3 * OBSERVATION_ENEMIES].reshape(OBSERVATION_ENEMIES, 3)
+        enemies[:] = 0
+        centerx, centery = player.rect.center
+        manager = game.enemies
+        living = numpy.flatnonzero(manager.alive & ~manager.dying)
+        dx = manager.x[living] + manager.width // 2 - centerx
+        dy = manager.y[living] + manager.height // 2 - centery
+        nearest = numpy.argsort(numpy.abs(dx), kind="stable")[:OBSERVATION_ENEMIES]
+        enemies[:len(nearest), 0] = dx[nearest]
+        enemies[:len(nearest), 1] = dy[nearest]
+        enemies[:len(nearest), 2] = 1
+
+        # Blocchi solidi attorno al giocatore (fuori dalla mappa contano come vuoti)
+        grid = game.tile_grid
+        first_col = centerx // grid.tile_size - OBSERVATION_COLUMNS_BEHIND
+        columns = OBSERVATION_COLUMNS_BEHIND + 1 + OBSERVATION_COLUMNS_AHEAD
+        tiles = out[PLAYER_FIELDS + 3 * OBSERVATION_ENEMIES:].reshape(grid.rows, columns)
+        tiles[:] = 0
+        start = max(0, first_col)
+        stop = min(grid.cols, first_col + columns)
+        if start < stop:
+            for row, cells in zip(tiles, grid.cells):
+                row[start - first_col:stop - first_col] = numpy.frombuffer(cells, dtype=numpy.uint8, count=stop - start, offset=start)
+        return out
+
+
+def _worker(connection, seeds, first, level_map, max_ticks, names, num_envs):
+    """Processo che gestisce un gruppo contiguo di partite e scrive i risultati nella memoria condivisa."""
+    envs = [ValentiEnv(seed, level_map, max_ticks) for seed in seeds]
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    observations, rewards, dones, scores, actions = _shared_views(blocks, num_envs, envs[0].observation_size)
+    try:
+        while True:
+            command = connection.recv()
+            if command == "reset":
+                for i, env in enumerate(envs, first):
+                    env.reset(out=observations[i])
+            elif command == "step":
+                for i, env in enumerate(envs, first):
+                    _, rewards[i], dones[i], info = env.step(actions[i], out=observations[i])
+                    if dones[i]:
+                        # Reset automatico: l'osservazione restituita è già quella del nuovo episodio
+                        scores[i] = info["final_score"]
+                        env.reset(out=observations[i])
+            else:
+                break
+            connection.send(True)
+    finally:
+        del observations, rewards, dones, scores, actions
+        for block in blocks:
+            block.close()
+        for env in envs:
+            env.close()
+
+
+def _shared_views(blocks, num_envs, size):
+    observations = numpy.ndarray((num_envs, size), dtype=numpy.float32, buffer=blocks[0].buf)
+    rewards = numpy.ndarray(num_envs, dtype=numpy.float64, buffer=blocks[1].buf)
+    dones = numpy.ndarray(num_envs, dtype=numpy.bool_, buffer=blocks[2].buf)
+    scores = numpy.ndarray(num_envs, dtype=numpy.float64, buffer=blocks[3].buf)
+    actions = numpy.ndarray(num_envs, dtype=numpy.int8, buffer=blocks[4].buf)
+    return observations, rewards, dones, scores, actions
+
+
+class VectorValentiEnv:
+    """num_envs partite indipendenti distribuite su un pool di processi e avanzate in parallelo a ogni step().
+
+    Azioni, osservazioni, ricompense e flag di fine stanno in memoria condivisa: attraverso le pipe passano
+    solo i comandi. Gli array restituiti sono viste su quella memoria, sovrascritte dallo step successivo.
+    Quando una partita finisce viene subito ricominciata; il suo punteggio finale resta in episode_scores.
+    """
+    def __init__(self, num_envs, seed=0, level_map=None, max_ticks=MAX_EPISODE_TICKS, workers=None):
+        self.num_envs = num_envs
+        workers = max(1, min(num_envs, workers or os.cpu_count() or 1))
+
+        # La dimensione dell'osservazione dipende solo dal numero di righe della mappa
+        if level_map is None:
+            import valenti
+            rows = len(valenti.LEVEL_MAP)
+        else:
+            rows = len(level_map)
+        self.observation_size = observation_size(rows)
+
+        sizes = [num_envs * self.observation_size * 4, num_envs * 8, num_envs, num_envs * 8, num_envs]
+        self.blocks = []
+        self.connections = []
+        self.processes = []
+        try:
+            for size in sizes:
+                self.blocks.append(shared_memory.SharedMemory(create=True, size=size))
+            self.observations, self.rewards, self.dones, self.episode_scores, self.actions = _shared_views(
+                self.blocks, num_envs, self.observation_size)
+            self.episode_scores[:] = 0
+
+            context = multiprocessing.get_context("spawn")
+            names = [block.name for block in self.blocks]
+            for worker in range(workers):
+                first = worker * num_envs // workers
+                last = (worker + 1) * num_envs // workers
+                parent, child = context.Pipe()
+                process = context.Process(target=_worker, daemon=True,
+                                          args=(child, [seed + i for i in range(first, last)], first, level_map,
+                                                max_ticks, names, num_envs))
+                process.start()
+                child.close()
+                self.connections.append(parent)
+                self.processes.append(process)
+        except BaseException:
+            self.close() # Nessun blocco di memoria condivisa orfano se la creazione si ferma a metà
+            raise
+
+    def _broadcast(self, command):
+        try:
+            for connection in self.connections:
+                connection.send(command)
+            for connection in self.connections:
+                connection.recv()
+        except (BrokenPipeError, EOFError, OSError) as e:
+            raise RuntimeError("un processo di VectorValentiEnv è terminato (il suo errore è stampato sopra)") from e
+
+    def reset(self):
+        self._broadcast("reset")
+        return self.observations
+
+    def step(self, actions):
+        """Applica un'azione (indice in ACTIONS) per partita; restituisce (osservazioni, ricompense, finiti)."""
+        self.actions[:] = actions
+        self._broadcast("step")
+        return self.observations, self.rewards, self.dones
+
+    def close(self):
+        """Ferma i processi e libera la memoria condivisa, anche se qualche processo è già morto."""
+        if not self.blocks:
+            return
+        try:
+            for connection in self.connections:
+                try:
+                    connection.send("close")
+                except (BrokenPipeError, EOFError, OSError):
+                    pass # Processo già terminato
+            for process in self.processes:
+                process.join()
+        finally:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+            self.processes = []
+            # Prima si lasciano le viste sui blocchi, poi si rimuovono i nomi e si chiudono i blocchi
+            self.observations = self.rewards = self.dones = self.episode_scores = self.actions = None
+            blocks, self.blocks = self.blocks, []
+            for block in blocks:
+                block.unlink()
+            for block in blocks:
+                block.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def check_reset(seed=0, ticks=600, episodes=3):
+    """Verifica che reset() renda gli episodi indipendenti: stesso seme e stesse azioni danno la stessa traiettoria
+    in un ambiente nuovo e dopo ogni reset. Restituisce le lunghezze degli episodi; solleva AssertionError se no."""
+    actions = numpy.random.default_rng(seed).integers(len(ACTIONS), size=ticks)
+
+    def play(env):
+        observations = [env.reset(seed).copy()]
+        for action in actions:
+            observation, reward, done, _ = env.step(action)
+            observations.append(observation.copy())
+            if done:
+                break
+        return numpy.array(observations)
+
+    expected = play(ValentiEnv(seed))
+    env = ValentiEnv(seed)
+    lengths = [len(expected)]
+    for episode in range(episodes):
+        trajectory = play(env)
+        lengths.append(len(trajectory))
+        assert trajectory.shape == expected.shape and (trajectory == expected).all(), \
+            f"l'episodio {episode + 1} dopo reset() diverge da quello di un ambiente nuovo (lunghezze {lengths})"
+    env.close()
+    return lengths
+
+
+if __name__ == "__main__":
+    print("reset() deterministico, lunghezze degli episodi:", check_reset())